@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Post, Group, Comment, Follow
+from .models import Post, Group, Comment, Follow, StoredImage, UserStats
+from .search import FTS_TABLE, match_expression, search_enabled
 
 
 class PostsAdmin(admin.ModelAdmin):
@@ -11,8 +12,26 @@ class PostsAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE по тексту."""
+        match = match_expression(search_term)
+        if not search_enabled() or not match:
+            return super().get_search_results(
+                request, queryset, search_term)
+        table = queryset.model._meta.db_table
+        found = queryset.extra(
+            where=[
+                f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[match],
+        )
+        return found, False
+
 
 admin.site.register(Post, PostsAdmin)
 admin.site.register(Group)
 admin.site.register(Comment)
 admin.site.register(Follow)
+admin.site.register(UserStats)
+admin.site.register(StoredImage)
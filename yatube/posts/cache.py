@@ -0,0 +1,232 @@
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+
+# Срок жизни фрагментов лент: устаревшие версии сбрасываются сигналами.
+FEED_CACHE_TIMEOUT: int = getattr(settings, 'FEED_CACHE_TIMEOUT', 60 * 60 * 6)
+# Через сколько секунд фрагмент обновляется в фоне; до жёсткого срока
+# FEED_CACHE_TIMEOUT читатели получают прежнюю копию.
+FEED_CACHE_SOFT_TIMEOUT: int = getattr(
+    settings, 'FEED_CACHE_SOFT_TIMEOUT', 60)
+# Потоки фонового обновления; 0 — обновлять в потоке запроса.
+FEED_REFRESH_WORKERS: int = getattr(settings, 'FEED_REFRESH_WORKERS', 2)
+# Срок блокировки обновления и сколько ждать чужого расчёта при промахе.
+FEED_LOCK_TIMEOUT: int = getattr(settings, 'FEED_LOCK_TIMEOUT', 30)
+FEED_LOCK_WAIT: float = getattr(settings, 'FEED_LOCK_WAIT', 2.0)
+LOCK_POLL_INTERVAL = 0.05
+# Заголовок ответа: страница взята из кэша (HIT), отрисована (MISS)
+# или кэш не применялся (BYPASS).
+PAGE_CACHE_HEADER = 'X-Page-Cache'
+# Параметры запроса, от которых зависит содержимое страницы ленты.
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def _version_key(feed: str, key='') -> str:
+    return f'feed-version:{feed}:{key}'
+
+
+def _initial_version() -> int:
+    # Версия от времени не повторяет прежние, если ключ вытеснили из кэша.
+    return int(time.time() * 1000)
+
+
+def feed_version(feed: str, key='') -> int:
+    """Текущая версия ленты feed (index, group, profile)."""
+    version_key = _version_key(feed, key)
+    version = cache.get(version_key)
+    if version is None:
+        version = _initial_version()
+        if not cache.add(version_key, version, None):
+            version = cache.get(version_key, version)
+    return version
+
+
+def bump_feed_version(feed: str, key='') -> None:
+    """Делает недействительными все закэшированные страницы ленты."""
+    version_key = _version_key(feed, key)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        cache.set(version_key, _initial_version(), None)
+
+
+def _position(request) -> str:
+    return '&'.join(
+        f'{param}={request.GET[param]}'
+        for param in PAGE_PARAMS if param in request.GET
+    )
+
+
+def feed_cache_key(request, feed: str, key='') -> str:
+    """Ключ фрагмента страницы ленты: версия ленты и позиция страницы."""
+    return f'{feed}:{key}:{feed_version(feed, key)}:{_position(request)}'
+
+
+def feed_slot(request, feed: str, key='') -> str:
+    """Место фрагмента в кэше: та же страница ленты во всех версиях."""
+    return f'feed-fragment:{feed}:{key}:{_position(request)}'
+
+
+def bump_post_feeds(post, group_ids=()) -> None:
+    """Сбрасывает ленты, в которых выводится пост."""
+    bump_feed_version('index')
+    bump_feed_version('profile', post.author_id)
+    for group_id in {post.group_id, *group_ids} - {None}:
+        bump_feed_version('group', group_id)
+
+
+def _user_tag(request) -> str:
+    """Часть ETag, зависящая от пользователя.
+
+    Шапка и кнопки страницы зависят от пользователя, а формы — от его
+    CSRF-токена, который меняется при каждом входе. Без токена в ETag
+    браузер после повторного входа получил бы 304 и отправил форму
+    со старым токеном.
+    """
+    if not request.user.is_authenticated:
+        return 'anon'
+    return f'{request.user.pk}:{request.META.get("CSRF_COOKIE", "")}'
+
+
+def page_etag(request, *parts) -> str:
+    """ETag страницы из версий её данных и пользователя."""
+    raw = ':'.join(str(part) for part in (*parts, _user_tag(request)))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def feed_etag(request, feed: str, key='') -> str:
+    """ETag страницы ленты: тот же ключ, что у фрагмента в кэше."""
+    return page_etag(request, feed_cache_key(request, feed, key))
+
+
+def cache_anonymous_page(etag_func):
+    """Кэширует страницу целиком для анонимных читателей.
+
+    Ключ строится из пути и ETag страницы, а ETag — из версий данных,
+    которые сигналы меняют при записи. Поэтому изменение поста,
+    комментария, группы или подписки сбрасывает ровно те страницы,
+    где они выводятся, а старые копии просто истекают.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = None
+            if request.method == 'GET' and not request.user.is_authenticated:
+                etag = etag_func(request, *args, **kwargs)
+            if etag is None:
+                response = view(request, *args, **kwargs)
+                response[PAGE_CACHE_HEADER] = 'BYPASS'
+                return response
+            key = f'page:{request.path}:{etag}'
+            response = cache.get(key)
+            if response is not None:
+                response[PAGE_CACHE_HEADER] = 'HIT'
+                return response
+            response = view(request, *args, **kwargs)
+            response[PAGE_CACHE_HEADER] = 'MISS'
+            # Ответы с куками (например, сессией) индивидуальны.
+            if response.status_code == 200 and not response.cookies:
+                def store(rendered):
+                    cache.set(key, rendered, FEED_CACHE_TIMEOUT)
+                if callable(getattr(response, 'render', None)):
+                    response.add_post_render_callback(store)
+                else:
+                    store(response)
+            return response
+        return wrapper
+    return decorator
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=FEED_REFRESH_WORKERS,
+                thread_name_prefix='feed-refresh')
+    return _executor
+
+
+def _lock_key(slot: str) -> str:
+    return f'refresh-lock:{slot}'
+
+
+def _refresh(slot: str, tag: str, compute, hard_timeout: int,
+             soft_timeout: int, locked: bool = True):
+    """Считает значение, кладёт его в слот и снимает блокировку."""
+    try:
+        value = compute()
+        cache.set(
+            slot, (tag, time.time() + soft_timeout, value), hard_timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(_lock_key(slot))
+
+
+def _refresh_in_background(*args) -> None:
+    try:
+        _refresh(*args)
+    finally:
+        close_old_connections()
+
+
+def _wait_for(slot: str, tag: str):
+    """Ждёт, пока держатель блокировки посчитает значение версии tag."""
+    deadline = time.monotonic() + FEED_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(slot)
+        if entry is not None and entry[0] == tag:
+            return entry
+    return None
+
+
+def stale_while_revalidate(slot: str, tag: str, compute,
+                           soft_timeout: int = None,
+                           hard_timeout: int = None):
+    """Значение из кэша, которое пересчитывает только один запрос.
+
+    В слоте лежит значение вместе с меткой tag (обычно ключом с версией
+    данных) и сроком свежести. Значение с той же меткой, у которого
+    истёк только срок свежести, отдаётся сразу, а пересчёт берёт тот,
+    кто первым захватил блокировку: в фоне либо, если
+    FEED_REFRESH_WORKERS = 0, в своём потоке. Значение другой версии
+    не отдаётся никогда, иначе автор не увидит свою запись: его, как
+    и отсутствующее значение, пересчитывают сразу, а остальные запросы
+    ждут держателя блокировки не дольше FEED_LOCK_WAIT секунд и только
+    потом считают сами.
+    """
+    if soft_timeout is None:
+        soft_timeout = FEED_CACHE_SOFT_TIMEOUT
+    if hard_timeout is None:
+        hard_timeout = FEED_CACHE_TIMEOUT
+    args = (slot, tag, compute, hard_timeout, soft_timeout)
+    stale = None
+    entry = cache.get(slot)
+    if entry is not None and entry[0] == tag:
+        _, refresh_at, stale = entry
+        if time.time() < refresh_at:
+            return stale
+    if not cache.add(_lock_key(slot), 1, FEED_LOCK_TIMEOUT):
+        if stale is not None:
+            return stale
+        entry = _wait_for(slot, tag)
+        if entry is None:
+            return _refresh(*args, locked=False)
+        return entry[2]
+    if stale is None or not FEED_REFRESH_WORKERS:
+        return _refresh(*args)
+    _get_executor().submit(_refresh_in_background, *args)
+    return stale
@@ -0,0 +1,224 @@
+"""Обёртка кэша со сжатием больших значений.
+
+Фрагменты лент и страницы целиком занимают десятки килобайт HTML,
+который хорошо сжимается. Обёртка сериализует значение компактно
+(строки — в UTF-8, остальное — pickle), сжимает результат, если он
+больше MIN_SIZE, и передаёт байты настоящему бэкенду из OPTIONS['CACHE'].
+Целые числа хранятся как есть, чтобы incr оставался атомарным.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'posts.compressed_cache.CompressedCache',
+            'OPTIONS': {
+                'CACHE': {'BACKEND': '...', 'LOCATION': '...'},
+                'CODEC': 'zlib',
+                'MIN_SIZE': 1024,
+            },
+        }
+    }
+"""
+import pickle
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django.utils.safestring import SafeString, mark_safe
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+# Сериализаторы: метка в первом байте, кодирование и декодирование.
+# Строки HTML из шаблонов (SafeString) остаются безопасными после чтения.
+SERIALIZERS = {
+    b'h': (str.encode, lambda data: mark_safe(data.decode())),
+    b'u': (str.encode, bytes.decode),
+    b'b': (bytes, bytes),
+    b'p': (
+        lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+        pickle.loads,
+    ),
+}
+# Метка кодека во втором байте; «-» — без сжатия.
+NO_CODEC = b'-'
+CODECS = {b'z': 'zlib', b'4': 'lz4'}
+KEY_PREFIX_RE = re.compile(r'[^:|]*')
+
+
+def key_prefix(key) -> str:
+    """Часть ключа до первого разделителя, по ней ведётся статистика."""
+    return KEY_PREFIX_RE.match(str(key)).group() or str(key)
+
+
+def _serializer(value) -> bytes:
+    if isinstance(value, SafeString):
+        return b'h'
+    if type(value) is str:
+        return b'u'
+    if type(value) is bytes:
+        return b'b'
+    return b'p'
+
+
+class CompressionStats:
+    """Степень сжатия и время кодирования по префиксам ключей."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: defaultdict(float))
+
+    def add(self, prefix: str, **values) -> None:
+        with self._lock:
+            counters = self._counters[prefix]
+            for name, value in values.items():
+                counters[name] += value
+
+    def report(self) -> dict:
+        """Префикс → число значений, объёмы, степень сжатия и время в мс."""
+        with self._lock:
+            counters = {
+                prefix: dict(values)
+                for prefix, values in self._counters.items()
+            }
+        report = {}
+        for prefix, values in counters.items():
+            stored = values.get('stored_bytes', 0)
+            report[prefix] = {
+                'encoded': int(values.get('encoded', 0)),
+                'decoded': int(values.get('decoded', 0)),
+                'raw_bytes': int(values.get('raw_bytes', 0)),
+                'stored_bytes': int(stored),
+                'ratio': values.get('raw_bytes', 0) / stored if stored else 1,
+                'encode_ms': values.get('encode_seconds', 0) * 1000,
+                'decode_ms': values.get('decode_seconds', 0) * 1000,
+            }
+        return report
+
+
+class CompressedCache(BaseCache):
+    """Бэкенд-обёртка: сжимает значения и ведёт статистику сжатия."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        try:
+            inner = dict(options['CACHE'])
+        except KeyError:
+            raise ImproperlyConfigured(
+                'CompressedCache: в OPTIONS нужен CACHE — настройки '
+                'кэша, в котором хранить сжатые значения.')
+        self._cache = import_string(inner.pop('BACKEND'))(
+            inner.pop('LOCATION', ''), inner)
+        self._min_size = int(options.get('MIN_SIZE', 1024))
+        self._level = int(options.get('LEVEL', 6))
+        self._codec = self._get_codec(options.get('CODEC', 'zlib'))
+        self.stats = CompressionStats()
+
+    @staticmethod
+    def _get_codec(name: str) -> bytes:
+        codes = {codec: code for code, codec in CODECS.items()}
+        if name not in codes:
+            raise ImproperlyConfigured(
+                f'CompressedCache: неизвестный кодек {name!r}.')
+        if name == 'lz4' and lz4 is None:
+            raise ImproperlyConfigured(
+                'CompressedCache: для кодека lz4 установите пакет lz4.')
+        return codes[name]
+
+    def _compress(self, data: bytes) -> bytes:
+        if self._codec == b'4':
+            return lz4.frame.compress(data)
+        return zlib.compress(data, self._level)
+
+    @staticmethod
+    def _decompress(codec: bytes, data: bytes) -> bytes:
+        if codec == b'4':
+            return lz4.frame.decompress(data)
+        return zlib.decompress(data)
+
+    def encode(self, key, value):
+        """Значение в виде для хранения: метки и, возможно, сжатые байты."""
+        if type(value) is int:
+            return value
+        started = time.perf_counter()
+        serializer = _serializer(value)
+        data = SERIALIZERS[serializer][0](value)
+        codec, stored = NO_CODEC, data
+        if len(data) >= self._min_size:
+            compressed = self._compress(data)
+            if len(compressed) < len(data):
+                codec, stored = self._codec, compressed
+        self.stats.add(
+            key_prefix(key), encoded=1, raw_bytes=len(data),
+            stored_bytes=len(stored) + 2,
+            encode_seconds=time.perf_counter() - started)
+        return serializer + codec + stored
+
+    def decode(self, key, stored):
+        if type(stored) is not bytes:
+            return stored
+        started = time.perf_counter()
+        serializer, codec = stored[:1], stored[1:2]
+        data = stored[2:]
+        if codec != NO_CODEC:
+            data = self._decompress(codec, data)
+        value = SERIALIZERS[serializer][1](data)
+        self.stats.add(
+            key_prefix(key), decoded=1,
+            decode_seconds=time.perf_counter() - started)
+        return value
+
+    def get(self, key, default=None, version=None):
+        stored = self._cache.get(key, version=version)
+        return default if stored is None else self.decode(key, stored)
+
+    def get_many(self, keys, version=None):
+        return {
+            key: self.decode(key, stored)
+            for key, stored in self._cache.get_many(
+                keys, version=version).items()
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._cache.set(
+            key, self.encode(key, value), timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.set_many(
+            {key: self.encode(key, value) for key, value in data.items()},
+            timeout=timeout, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.add(
+            key, self.encode(key, value), timeout=timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._cache.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._cache.decr(key, delta, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.touch(key, timeout=timeout, version=version)
+
+    def has_key(self, key, version=None):
+        return self._cache.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        return self._cache.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        return self._cache.delete_many(keys, version=version)
+
+    def clear(self):
+        self._cache.clear()
+
+    def close(self, **kwargs):
+        self._cache.close(**kwargs)
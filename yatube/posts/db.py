@@ -0,0 +1,42 @@
+"""Настройка соединений SQLite для одновременных чтения и записи.
+
+В режиме журнала по умолчанию пишущая транзакция блокирует всех
+читателей, и под нагрузкой запросы падают с «database is locked».
+В режиме WAL читатели работают параллельно с записью, а ожидание
+блокировки ограничено busy_timeout, а не мгновенной ошибкой.
+"""
+from django.conf import settings
+from .sharding import sharding_enabled
+
+
+# Прагмы выполняются при открытии каждого соединения.
+SQLITE_PRAGMAS: dict = getattr(settings, 'SQLITE_PRAGMAS', {
+    'journal_mode': 'wal',
+    # В режиме WAL normal не теряет целостность, а fsync идёт только
+    # при контрольной точке.
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер страничного кэша в КиБ.
+    'cache_size': -64000,
+    'temp_store': 'memory',
+})
+
+
+def pragma_statements(pragmas=None) -> list:
+    """Команды PRAGMA для настроек pragmas."""
+    if pragmas is None:
+        pragmas = dict(SQLITE_PRAGMAS)
+        if sharding_enabled():
+            # Автор и группа поста в шарде лежат в другой базе.
+            pragmas['foreign_keys'] = 'off'
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def configure_connection(connection) -> None:
+    """Применяет SQLITE_PRAGMAS к новому соединению Django."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements():
+            cursor.execute(statement)
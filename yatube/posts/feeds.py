@@ -0,0 +1,150 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.paginator import Page
+from .models import Post, Follow, TimelineEntry, UserStats
+from .sharding import (
+    group_by_shard, shard_for_author, sharding_enabled, shards)
+from .utils import (
+    paginator, CursorPaginator, MergedCursorPaginator, TimelinePaginator)
+
+
+# Сколько последних постов автора попадает в ленту при подписке.
+FEED_BACKFILL_LIMIT: int = getattr(settings, 'FEED_BACKFILL_LIMIT', 1000)
+# С какого числа подписчиков посты автора не раскладываются по лентам,
+# а подмешиваются при чтении.
+FEED_CELEBRITY_THRESHOLD: int = getattr(
+    settings, 'FEED_CELEBRITY_THRESHOLD', 10000)
+FEED_BATCH_SIZE: int = 1000
+
+
+def _entry(user_id, post) -> TimelineEntry:
+    return TimelineEntry(
+        user_id=user_id,
+        post_id=post.pk,
+        author_id=post.author_id,
+        pub_date=post.pub_date,
+    )
+
+
+def _bulk_insert(entries) -> None:
+    """Вставляет записи ленты пачками, не держа все в памяти."""
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, FEED_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def is_celebrity(author_id) -> bool:
+    """Посты автора читаются напрямую, а не из материализованных лент."""
+    return UserStats.objects.filter(
+        pk=author_id, followers_count__gte=FEED_CELEBRITY_THRESHOLD).exists()
+
+
+def fan_out_post(post) -> None:
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    followers = (
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    _bulk_insert(_entry(user_id, post) for user_id in followers.iterator())
+
+
+def _recent_posts(author_id):
+    return (
+        Post.objects.using(shard_for_author(author_id))
+        .filter(author_id=author_id)
+        .order_by('-pub_date', '-pk')
+        .only('pk', 'author_id', 'pub_date')[:FEED_BACKFILL_LIMIT]
+    )
+
+
+def backfill_timeline(user_id, author_id) -> None:
+    """Добавляет в ленту подписчика последние посты автора."""
+    if is_celebrity(author_id):
+        return
+    _bulk_insert(_entry(user_id, post) for post in _recent_posts(author_id))
+
+
+def backfill_former_celebrity(author_id) -> None:
+    """Раскладывает посты автора, опустившегося ниже порога.
+
+    Пока автор был выше FEED_CELEBRITY_THRESHOLD, его посты подмешивались
+    при чтении и в ленты не попадали. Ниже порога они читаются только
+    из лент, поэтому при переходе порога вниз раскладываются заново.
+    Переход вверх обработки не требует: записи, разложенные до него,
+    выводятся вместе с подмешанными постами один раз.
+    """
+    followers_count = (
+        UserStats.objects.filter(pk=author_id)
+        .values_list('followers_count', flat=True)
+        .first()
+    )
+    if followers_count != FEED_CELEBRITY_THRESHOLD - 1:
+        return
+    posts = list(_recent_posts(author_id))
+    followers = (
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+    )
+    _bulk_insert(
+        _entry(user_id, post)
+        for user_id in followers.iterator()
+        for post in posts
+    )
+
+
+def prune_timeline(user_id, author_id) -> None:
+    """Убирает из ленты посты автора, от которого отписались."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id).delete()
+
+
+def posts_page(request, posts, posts_in_page: int,
+               with_count: bool = True) -> Page:
+    """Страница ленты постов posts.
+
+    При шардировании запрос выполняется в каждом шарде, а страницы
+    сливаются по ключу (pub_date, id); число записей не считается.
+    """
+    if not sharding_enabled():
+        return paginator(request, posts, posts_in_page, with_count)
+    sources = [(CursorPaginator, posts.using(alias)) for alias in shards()]
+    return paginator(
+        request, sources, posts_in_page, with_count=False,
+        paginator_class=MergedCursorPaginator)
+
+
+def follow_feed_page(request, posts_in_page: int):
+    """Страница ленты подписок текущего пользователя.
+
+    Материализованная лента сливается с постами авторов, у которых
+    подписчиков не меньше FEED_CELEBRITY_THRESHOLD. Посты, попавшие
+    в ленту до того, как автор перешёл порог, выводятся один раз.
+    """
+    user = request.user
+    timeline = TimelineEntry.objects.for_feed(user)
+    celebrity_ids = list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gte=FEED_CELEBRITY_THRESHOLD,
+        ).values_list('author_id', flat=True)
+    )
+    if not celebrity_ids:
+        return paginator(
+            request, timeline, posts_in_page,
+            paginator_class=TimelinePaginator)
+    sources = [(TimelinePaginator, timeline)]
+    for alias, author_ids in group_by_shard(celebrity_ids).items():
+        pulled = (
+            Post.objects.using(alias).for_feed()
+            .filter(author_id__in=author_ids)
+        )
+        sources.append((CursorPaginator, pulled))
+    return paginator(
+        request, sources, posts_in_page, with_count=False,
+        paginator_class=MergedCursorPaginator)
@@ -1,4 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from .images import ingest_image, preview_image
+from .thumbnails import THUMBNAIL_ASPECT
 from .models import Post, Comment
 
 
@@ -14,6 +17,22 @@ class PostForm(forms.ModelForm):
             'image': 'Илюстрация поста'
         }
 
+    def clean_image(self):
+        """Сжимает загруженную картинку до компактного оригинала.
+
+        Превью-заглушка считается здесь же один раз, лента выводит
+        её без чтения файла.
+        """
+        image = self.cleaned_data.get('image')
+        self.image_report = None
+        if isinstance(image, UploadedFile):
+            image, self.image_report = ingest_image(image)
+            self.instance.image_placeholder = preview_image(
+                image, THUMBNAIL_ASPECT)
+        elif not image:
+            self.instance.image_placeholder = ''
+        return image
+
 
 class CommentForm(forms.ModelForm):
     """Форма коментария."""
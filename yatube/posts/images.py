@@ -0,0 +1,124 @@
+"""Приём иллюстраций постов.
+
+Загруженная картинка уменьшается до предельного размера, разворачивается
+по EXIF, теряет метаданные и сохраняется в WebP. Храним компактный
+оригинал, из которого потом нарезаются миниатюры, и крошечное
+превью-заглушку для ленты.
+"""
+import base64
+import logging
+import os
+from dataclasses import dataclass
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# Наибольшая сторона сохраняемой картинки в пикселях.
+IMAGE_MAX_SIZE: int = getattr(settings, 'IMAGE_MAX_SIZE', 2560)
+# Качество WebP от 1 до 100.
+IMAGE_QUALITY: int = getattr(settings, 'IMAGE_QUALITY', 80)
+IMAGE_FORMAT = 'WEBP'
+IMAGE_EXTENSION = '.webp'
+# Ширина превью-заглушки: её растягивает браузер, важны только цвета.
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_QUALITY = 40
+
+
+@dataclass
+class IngestReport:
+    """Итог обработки одной картинки."""
+
+    name: str
+    original_size: int
+    stored_size: int
+    original_dimensions: tuple
+    stored_dimensions: tuple
+
+    @property
+    def saved(self) -> int:
+        return self.original_size - self.stored_size
+
+    def __str__(self) -> str:
+        return (
+            f'{self.name}: {self.original_size} → {self.stored_size} байт '
+            f'(сэкономлено {self.saved}), '
+            f'{self.original_dimensions} → {self.stored_dimensions}'
+        )
+
+
+def _needs_reencode(image, size: int, stored_size: int) -> bool:
+    """Оригинал оставляем, только если он и так меньше и без метаданных."""
+    return (
+        stored_size < size
+        or max(image.size) > IMAGE_MAX_SIZE
+        or bool(image.getexif())
+        or bool(image.info.get('icc_profile'))
+    )
+
+
+def _encode(image) -> bytes:
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, IMAGE_FORMAT, quality=IMAGE_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def ingest_image(upload):
+    """Возвращает обработанный файл для поля image и отчёт.
+
+    Анимацию не трогаем: WebP-кодировщик собрал бы её покадрово в памяти.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload, None
+    original_dimensions = image.size
+    # Для JPEG draft декодирует сразу в уменьшенном масштабе.
+    image.draft('RGB', (IMAGE_MAX_SIZE, IMAGE_MAX_SIZE))
+    oriented = ImageOps.exif_transpose(image)
+    oriented.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE), Image.LANCZOS)
+    content = _encode(oriented)
+    if not _needs_reencode(image, upload.size, len(content)):
+        upload.seek(0)
+        return upload, None
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    stored = SimpleUploadedFile(
+        name + IMAGE_EXTENSION, content, content_type='image/webp')
+    report = IngestReport(
+        name=stored.name,
+        original_size=upload.size,
+        stored_size=stored.size,
+        original_dimensions=original_dimensions,
+        stored_dimensions=oriented.size,
+    )
+    logger.info('Картинка поста сохранена: %s', report)
+    return stored, report
+
+
+def preview_image(upload, aspect) -> str:
+    """Превью картинки в пропорциях aspect в виде data URI.
+
+    Карточки показывают картинку в кадре этих пропорций, поэтому
+    и заглушка обрезается так же.
+    """
+    upload.seek(0)
+    with Image.open(upload) as image:
+        image.draft('RGB', (PLACEHOLDER_WIDTH * 4, PLACEHOLDER_WIDTH * 4))
+        size = (
+            PLACEHOLDER_WIDTH,
+            max(1, round(PLACEHOLDER_WIDTH * aspect[1] / aspect[0])),
+        )
+        preview = ImageOps.fit(image.convert('RGB'), size, Image.LANCZOS)
+    upload.seek(0)
+    buffer = BytesIO()
+    preview.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/webp;base64,{encoded}'
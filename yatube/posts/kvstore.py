@@ -0,0 +1,42 @@
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class BulkKVStore(KVStore):
+    """Хранилище ключей sorl с пакетным чтением.
+
+    Записи читаются из кэша, промахи добираются из базы. get_many
+    отдаёт записи всех картинок страницы одним обращением к кэшу
+    и не больше чем одним запросом к базе.
+    """
+
+    def get_many(self, image_files) -> dict:
+        """Записи для image_files: ключ картинки → ImageFile или None."""
+        raw_keys = {
+            add_prefix(image_file.key): image_file.key
+            for image_file in image_files
+        }
+        if not raw_keys:
+            return {}
+        values = self.cache.get_many(list(raw_keys))
+        missing = [key for key in raw_keys if key not in values]
+        if missing:
+            found = dict(
+                KVStoreModel.objects.filter(key__in=missing)
+                .values_list('key', 'value')
+            )
+            # Отсутствие тоже кэшируем, как это делает _get_raw.
+            fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(fetched, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        result = {}
+        for raw_key, key in raw_keys.items():
+            value = values[raw_key]
+            if value == EMPTY_VALUE or not value:
+                result[key] = None
+            else:
+                result[key] = deserialize_image_file(value)
+        return result
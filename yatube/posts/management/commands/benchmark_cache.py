@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from posts.compressed_cache import CompressedCache
+from posts.sqlite_cache import SQLiteCache
+
+
+class Command(BaseCommand):
+    """Сравнивает скорость бэкендов кэша на типичных операциях лент."""
+
+    help = (
+        'Замеряет set, get, get_many и incr для LocMemCache, '
+        'FileBasedCache, SQLiteCache и SQLiteCache со сжатием.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ops',
+            type=int,
+            default=2000,
+            help='Сколько операций каждого вида выполнить.'
+        )
+        parser.add_argument(
+            '--value-size',
+            type=int,
+            default=4096,
+            help='Размер значения в байтах, по умолчанию как у фрагмента.'
+        )
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        # Значение похоже на HTML карточек ленты, а не на один символ.
+        value = ''.join(
+            f'<article class="card">Пост {number}</article>'
+            for number in range(options['value_size'] // 30)
+        )[:options['value_size']]
+        params = {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': ops * 2}}
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'LocMemCache': LocMemCache('benchmark', params),
+                'FileBasedCache': FileBasedCache(
+                    os.path.join(directory, 'files'), params),
+                'SQLiteCache': SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), params),
+                'Compressed': CompressedCache('', {'OPTIONS': {
+                    'CACHE': {
+                        'BACKEND': 'posts.sqlite_cache.SQLiteCache',
+                        'LOCATION': os.path.join(directory, 'zlib.sqlite3'),
+                        **params,
+                    },
+                }}),
+            }
+            operations = self._operations(ops, value)
+            self.stdout.write(
+                f'{"бэкенд":<16}'
+                + ''.join(f'{name:>12}' for name in operations)
+                + '   (мкс на операцию)'
+            )
+            for name, backend in backends.items():
+                timings = [
+                    self._measure(backend, operation, ops)
+                    for operation in operations.values()
+                ]
+                self.stdout.write(
+                    f'{name:<16}'
+                    + ''.join(f'{timing:>12.1f}' for timing in timings)
+                )
+                backend.clear()
+            self._write_compression(backends['Compressed'])
+        self.stdout.write(
+            'LocMemCache быстрее всех, но у каждого процесса он свой: '
+            'воркеры не видят записей и сбросов друг друга.'
+        )
+
+    def _write_compression(self, backend) -> None:
+        for prefix, stats in backend.stats.report().items():
+            self.stdout.write(
+                f'Сжатие {prefix}: {stats["ratio"]:.1f}x, '
+                f'кодирование {stats["encode_ms"]:.1f} мс '
+                f'на {stats["encoded"]}, '
+                f'декодирование {stats["decode_ms"]:.1f} мс '
+                f'на {stats["decoded"]}.'
+            )
+
+    @staticmethod
+    def _operations(ops: int, value: str) -> dict:
+        keys = [f'feed:index:{number}' for number in range(ops)]
+        return {
+            'set': lambda cache, i: cache.set(keys[i], value),
+            'get': lambda cache, i: cache.get(keys[i]),
+            'get_many': lambda cache, i: cache.get_many(keys[i:i + 10]),
+            'incr': lambda cache, i: (
+                cache.add('version', 0), cache.incr('version')),
+        }
+
+    @staticmethod
+    def _measure(backend, operation, ops: int) -> float:
+        """Среднее время операции в микросекундах."""
+        started = time.perf_counter()
+        for number in range(ops):
+            operation(backend, number)
+        return (time.perf_counter() - started) / ops * 10 ** 6
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from posts.db import pragma_statements
+
+
+SCHEMA = (
+    'CREATE TABLE post (id INTEGER PRIMARY KEY, text TEXT, pub_date REAL)',
+    'CREATE INDEX post_pub_date ON post (pub_date)',
+)
+READ = 'SELECT id, text FROM post ORDER BY pub_date DESC LIMIT 10'
+WRITE = 'INSERT INTO post (text, pub_date) VALUES (?, ?)'
+
+
+class Command(BaseCommand):
+    """Сравнивает пропускную способность SQLite до и после настройки."""
+
+    help = (
+        'Запускает читателей и писателей на одной базе SQLite с прагмами '
+        'по умолчанию и с SQLITE_PRAGMAS и выводит число операций.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seconds', type=float, default=3,
+            help='Длительность каждого замера.')
+        parser.add_argument(
+            '--readers', type=int, default=4,
+            help='Сколько потоков читают ленту.')
+        parser.add_argument(
+            '--writers', type=int, default=2,
+            help='Сколько потоков публикуют посты.')
+        parser.add_argument(
+            '--timeout', type=float, default=5,
+            help='Ожидание блокировки в режиме по умолчанию, секунды; '
+                 'по умолчанию как у Django.')
+
+    def handle(self, *args, **options):
+        modes = {
+            'по умолчанию': [],
+            'SQLITE_PRAGMAS': pragma_statements(),
+        }
+        self.stdout.write(
+            f'{"режим":<16}{"чтений/с":>12}{"записей/с":>12}'
+            f'{"ошибок":>10}')
+        for name, pragmas in modes.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                reads, writes, errors = self._run(path, pragmas, options)
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{name:<16}{reads / seconds:>12.0f}'
+                f'{writes / seconds:>12.0f}{errors:>10}')
+
+    @staticmethod
+    def _connect(path, pragmas, timeout):
+        connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None,
+            check_same_thread=False)
+        for statement in pragmas:
+            connection.execute(statement)
+        return connection
+
+    def _run(self, path, pragmas, options):
+        """Счётчики чтений, записей и ошибок блокировки за замер."""
+        setup = self._connect(path, pragmas, options['timeout'])
+        for statement in SCHEMA:
+            setup.execute(statement)
+        setup.executemany(
+            WRITE, [(f'Пост {i}', i) for i in range(1000)])
+        setup.close()
+        counters = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+
+        def worker(query, counter):
+            connection = self._connect(path, pragmas, options['timeout'])
+            done = errors = 0
+            while time.monotonic() < deadline:
+                try:
+                    if query is WRITE:
+                        connection.execute(WRITE, ('Пост', time.time()))
+                    else:
+                        connection.execute(query).fetchall()
+                    done += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+            connection.close()
+            with lock:
+                counters[counter] += done
+                counters['errors'] += errors
+
+        threads = (
+            [threading.Thread(target=worker, args=(READ, 'reads'))
+             for _ in range(options['readers'])]
+            + [threading.Thread(target=worker, args=(WRITE, 'writes'))
+               for _ in range(options['writers'])]
+        )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counters['reads'], counters['writes'], counters['errors']
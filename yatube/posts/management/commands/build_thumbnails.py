@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from posts.images import preview_image
+from posts.models import Post
+from posts.sharding import shards
+from posts.storage import post_image_storage
+from posts.thumbnails import (
+    THUMBNAIL_ASPECT, THUMBNAIL_SIZES, generate_thumbnails)
+
+
+class Command(BaseCommand):
+    """Строит миниатюры и превью картинок, загруженных раньше."""
+
+    help = 'Строит недостающие миниатюры и превью иллюстраций постов.'
+
+    def handle(self, *args, **options):
+        names = set()
+        for alias in shards():
+            names.update(
+                Post.objects.using(alias).exclude(image='')
+                .order_by().values_list('image', flat=True).distinct()
+            )
+        count = previews = 0
+        for name in sorted(names):
+            generate_thumbnails(name)
+            count += 1
+            previews += self._fill_preview(name)
+        sizes = ', '.join(geometry for geometry, _ in THUMBNAIL_SIZES)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {count} (размеры {sizes}), '
+            f'добавлено превью: {previews}.'
+        ))
+
+    def _fill_preview(self, name: str) -> int:
+        """Превью для постов с картинкой name, где его нет."""
+        querysets = [
+            Post.objects.using(alias).filter(
+                image=name, image_placeholder='')
+            for alias in shards()
+        ]
+        querysets = [posts for posts in querysets if posts.exists()]
+        if not querysets:
+            return 0
+        try:
+            with post_image_storage.open(name) as file:
+                placeholder = preview_image(file, THUMBNAIL_ASPECT)
+        except OSError as error:
+            self.stderr.write(f'{name}: {error}')
+            return 0
+        return sum(
+            posts.update(image_placeholder=placeholder)
+            for posts in querysets
+        )
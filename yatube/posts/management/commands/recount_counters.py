@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from posts.models import Post, UserStats
+from posts.sharding import shards
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Сверяет денормализованные счётчики с реальными данными."""
+
+    help = 'Пересчитывает счётчики постов, подписок и комментариев.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк пересчитывать за один проход.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users_fixed = 0
+        for batch in self._batches(User.objects.all(), batch_size):
+            users_fixed += UserStats.objects.recount(batch)
+        posts_fixed = 0
+        for alias in shards():
+            posts = Post.objects.using(alias)
+            for batch in self._batches(posts.all(), batch_size):
+                posts_fixed += posts.filter(pk__in=batch).recount_comments()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: пользователей {users_fixed}, '
+            f'постов {posts_fixed}.'
+        ))
+
+    @staticmethod
+    def _batches(queryset, batch_size):
+        """Первичные ключи пачками по возрастанию без OFFSET."""
+        last_pk = None
+        queryset = queryset.order_by('pk').values_list('pk', flat=True)
+        while True:
+            page = queryset
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            batch = list(page[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1]
@@ -0,0 +1,163 @@
+"""Индекс полнотекстового поиска по постам на SQLite FTS5.
+
+Миграция не импортирует posts.search: таблица и стеммер заморожены
+здесь в том виде, в каком они были при её создании, чтобы правки
+модуля не меняли историю миграций.
+"""
+import re
+
+from django.db import migrations
+
+
+FTS_TABLE = 'posts_post_fts'
+BATCH_SIZE = 500
+WORD_RE = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+
+# Окончания стеммера Snowball для русского языка. Для окончаний
+# с флагом True перед ними в слове должна стоять «а» или «я».
+PERFECTIVE_GERUND = (
+    [(ending, True) for ending in ('в', 'вши', 'вшись')]
+    + [(ending, False) for ending in ('ив', 'ивши', 'ившись',
+                                      'ыв', 'ывши', 'ывшись')]
+)
+ADJECTIVE = [(ending, False) for ending in (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+)]
+PARTICIPLE = (
+    [(ending, True) for ending in ('ем', 'нн', 'вш', 'ющ', 'щ')]
+    + [(ending, False) for ending in ('ивш', 'ывш', 'ующ')]
+)
+REFLEXIVE = [(ending, False) for ending in ('ся', 'сь')]
+VERB = (
+    [(ending, True) for ending in (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    )]
+    + [(ending, False) for ending in (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    )]
+)
+NOUN = [(ending, False) for ending in (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+)]
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _strip(word: str, endings):
+    """Отрезает самое длинное окончание из endings или возвращает None."""
+    for ending, after_a in sorted(endings, key=lambda e: -len(e[0])):
+        if word.endswith(ending):
+            base = word[:-len(ending)]
+            if after_a and not base.endswith(('а', 'я')):
+                return None
+            return base
+    return None
+
+
+def _region_after(word: str, start: int) -> int:
+    """Начало области после первой пары «гласная + согласная»."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip_inflection(rv: str) -> str:
+    """Шаг 1: деепричастие либо возвратность и окончание."""
+    stripped = _strip(rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        return stripped
+    reflexive = _strip(rv, REFLEXIVE)
+    if reflexive is not None:
+        rv = reflexive
+    adjective = _strip(rv, ADJECTIVE)
+    if adjective is not None:
+        participle = _strip(adjective, PARTICIPLE)
+        return adjective if participle is None else participle
+    for endings in (VERB, NOUN):
+        stripped = _strip(rv, endings)
+        if stripped is not None:
+            return stripped
+    return rv
+
+
+def _tidy_up(rv: str) -> str:
+    """Шаг 4: превосходная степень, удвоенная «н» и мягкий знак."""
+    superlative = _strip(rv, [(ending, False) for ending in SUPERLATIVE])
+    if superlative is not None:
+        rv = superlative
+    elif rv.endswith('ь'):
+        return rv[:-1]
+    return rv[:-1] if rv.endswith('нн') else rv
+
+
+def stem(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball."""
+    word = word.lower().replace('ё', 'е')
+    rv_start = next(
+        (i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+    r2_start = _region_after(word, _region_after(word, 0)) - rv_start
+
+    rv = _strip_inflection(rv)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    for ending in DERIVATIONAL:
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2_start:
+            rv = rv[:-len(ending)]
+            break
+    return prefix + _tidy_up(rv)
+
+
+def index_text(text: str) -> str:
+    """Текст поста в виде основ слов для индекса."""
+    return ' '.join(stem(word) for word in WORD_RE.findall(text))
+
+
+def build_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+        f'USING fts5(stems, tokenize="unicode61 remove_diacritics 2")'
+    )
+    Post = apps.get_model('posts', 'Post')
+    rows = Post.objects.values_list('pk', 'text').iterator()
+    with schema_editor.connection.cursor() as cursor:
+        batch = []
+        for pk, text in rows:
+            batch.append((pk, index_text(text)))
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(
+                    f'INSERT INTO {FTS_TABLE} (rowid, stems) '
+                    f'VALUES (%s, %s)', batch)
+                batch = []
+        if batch:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, stems) VALUES (%s, %s)',
+                batch)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_post_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_index, drop_index),
+    ]
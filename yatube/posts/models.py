@@ -1,9 +1,79 @@
 from django.db import models
+from django.db.models import Count, F
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from .sharding import ShardedQuerySet, shards, sharding_enabled
+from .storage import post_image_storage
 
 
 User = get_user_model()
 
+# Поля автора и группы, которые не выводятся в ленте.
+FEED_DEFERRED_FIELDS = (
+    'author__password',
+    'author__last_login',
+    'author__is_superuser',
+    'author__email',
+    'author__is_staff',
+    'author__is_active',
+    'author__date_joined',
+    'group__description',
+)
+
+
+class PostQuerySet(ShardedQuerySet):
+    """Запросы к постам."""
+
+    def for_feed(self):
+        """Посты для ленты: автор и группа подтягиваются тем же запросом.
+
+        В шардах автор и группа лежат в другой базе и догружаются
+        отдельными запросами.
+        """
+        if sharding_enabled():
+            return self.prefetch_related('author', 'group')
+        return (
+            self.select_related('author', 'group')
+            .defer(*FEED_DEFERRED_FIELDS)
+        )
+
+    def bump_comments(self, post_id, delta: int) -> None:
+        """Атомарно меняет счётчик комментариев поста.
+
+        Счётчик выводится в карточке поста, поэтому обновляется
+        и дата изменения, по которой кэшируется карточка. Время берётся
+        из Python: CURRENT_TIMESTAMP в SQLite точен только до секунды.
+        """
+        rows = self.filter(pk=post_id)
+        if delta < 0:
+            rows = rows.filter(comments_count__gte=-delta)
+        rows.update(
+            comments_count=F('comments_count') + delta,
+            updated=timezone.now())
+
+    def touch(self) -> int:
+        """Обновляет дату изменения, по которой кэшируются карточки.
+
+        Нужна, когда меняются выводимые в карточке группа или автор,
+        которые хранятся не в посте.
+        """
+        return self.update(updated=timezone.now())
+
+    def recount_comments(self) -> int:
+        """Пересчитывает счётчики комментариев, возвращает число правок."""
+        posts = list(
+            self.annotate(actual=Count('comments'))
+            .exclude(comments_count=F('actual'))
+            .only('pk')
+        )
+        now = timezone.now()
+        for post in posts:
+            post.comments_count = post.actual
+            post.updated = now
+        self.model.objects.db_manager(self.db).bulk_update(
+            posts, ['comments_count', 'updated'])
+        return len(posts)
+
 
 class Post(models.Model):
     """Модель поста."""
@@ -12,6 +82,7 @@ class Post(models.Model):
         'Текст поста',
         help_text='Введите текст поста')
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -29,8 +100,18 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_image_storage,
         blank=True
     )
+    image_placeholder = models.TextField(
+        'Превью картинки', blank=True, editable=False)
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self) -> str:
         return f'{self.text[:15]}'
@@ -39,6 +120,18 @@ class Post(models.Model):
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты сортируются по ключу (pub_date, id) курсорного паджинатора;
+        # индекс на каждый фильтр ленты отдаёт страницу без сортировки.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_feed_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_feed_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_feed_idx'),
+        ]
 
 
 class Group(models.Model):
@@ -69,6 +162,15 @@ class Comment(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('created',)
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     """Модель подписок."""
@@ -92,3 +194,222 @@ class Follow(models.Model):
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique follower')
         ]
+        # Подписчики автора при раскладке поста читаются только из индекса.
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'),
+        ]
+
+
+class UserStatsQuerySet(models.QuerySet):
+    """Запросы к счётчикам пользователей."""
+
+    def bump(self, user_id, field: str, delta: int) -> None:
+        """Атомарно меняет счётчик пользователя.
+
+        Отсутствующая строка при увеличении создаётся пересчётом,
+        при уменьшении пропускается до сверки командой recount_counters.
+        """
+        rows = self.filter(pk=user_id)
+        if delta < 0:
+            rows = rows.filter(**{f'{field}__gte': -delta})
+        updated = rows.update(**{field: F(field) + delta})
+        if not updated and delta > 0:
+            self.recount([user_id])
+
+    def recount(self, user_ids) -> int:
+        """Пересчитывает счётчики пользователей, возвращает число правок."""
+        user_ids = list(user_ids)
+        actual = {
+            user_id: dict.fromkeys(UserStats.COUNTERS, 0)
+            for user_id in user_ids
+        }
+        sources = (
+            *(('posts_count', Post.objects.using(alias), 'author_id')
+              for alias in shards()),
+            ('followers_count', Follow.objects, 'author_id'),
+            ('following_count', Follow.objects, 'user_id'),
+        )
+        for field, manager, key in sources:
+            rows = (
+                manager.filter(**{f'{key}__in': user_ids})
+                .order_by()
+                .values_list(key)
+                .annotate(total=Count('pk'))
+            )
+            for user_id, total in rows:
+                actual[user_id][field] += total
+        existing = self.model.objects.in_bulk(user_ids)
+        changed, created = [], []
+        for user_id, counters in actual.items():
+            stats = existing.get(user_id)
+            if stats is None:
+                created.append(self.model(user_id=user_id, **counters))
+                continue
+            if any(getattr(stats, name) != value
+                   for name, value in counters.items()):
+                for name, value in counters.items():
+                    setattr(stats, name, value)
+                changed.append(stats)
+        self.model.objects.bulk_create(created, ignore_conflicts=True)
+        self.model.objects.bulk_update(changed, UserStats.COUNTERS)
+        return len(created) + len(changed)
+
+    def for_user(self, user):
+        """Счётчики пользователя, при отсутствии строки она создаётся."""
+        try:
+            return user.stats
+        except UserStats.DoesNotExist:
+            self.recount([user.pk])
+            return self.get(pk=user.pk)
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+
+    COUNTERS = ('posts_count', 'followers_count', 'following_count')
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+
+    objects = UserStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class TimelineQuerySet(models.QuerySet):
+    """Запросы к материализованной ленте подписок."""
+
+    def for_feed(self, user):
+        """Записи ленты пользователя вместе с постами для вывода.
+
+        Посты из шардов паджинатор догружает сам.
+        """
+        if sharding_enabled():
+            return self.filter(user=user)
+        return (
+            self.filter(user=user)
+            .select_related('post__author', 'post__group')
+            .defer(*(f'post__{field}' for field in FEED_DEFERRED_FIELDS))
+        )
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписок пользователя.
+
+    Строки создаются при публикации поста для каждого подписчика,
+    поэтому лента читается диапазоном по индексу (user, pub_date).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста'
+    )
+    pub_date = models.DateTimeField('Дата публикации поста')
+
+    objects = TimelineQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique timeline post')
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_feed_idx'),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'),
+        ]
+
+
+class StoredImageQuerySet(models.QuerySet):
+    """Учёт ссылок постов на файлы картинок."""
+
+    def acquire(self, name: str) -> None:
+        """Добавляет ссылку на файл name."""
+        if not name:
+            return
+        updated = self.filter(pk=name).update(references=F('references') + 1)
+        if not updated:
+            _, created = self.get_or_create(
+                name=name, defaults={'references': 1})
+            if not created:
+                self.filter(pk=name).update(
+                    references=F('references') + 1)
+
+    def release(self, name: str) -> bool:
+        """Убирает ссылку на файл, True — если ссылок не осталось."""
+        if not name:
+            return False
+        self.filter(pk=name, references__gt=0).update(
+            references=F('references') - 1)
+        deleted, _ = self.filter(pk=name, references=0).delete()
+        return bool(deleted)
+
+
+class StoredImage(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются.
+
+    Одинаковые картинки хранятся одним файлом, и удалять его можно
+    только вместе с последним постом.
+    """
+
+    name = models.CharField('Имя файла', max_length=100, primary_key=True)
+    references = models.PositiveIntegerField('Число ссылок', default=0)
+
+    objects = StoredImageQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.references})'
+
+
+class PostLocation(models.Model):
+    """Справочник шардов: id поста и его автор.
+
+    При шардировании id поста выдаётся этой таблицей в default, поэтому
+    он уникален во всех шардах, а по автору находится шард поста.
+    """
+
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста'
+    )
+
+    class Meta:
+        verbose_name = 'Расположение поста'
+        verbose_name_plural = 'Расположения постов'
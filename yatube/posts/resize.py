@@ -0,0 +1,226 @@
+"""Картинки постов произвольного размера по подписанной ссылке.
+
+Параметры варианта (пост, ширина, высота, обрезка, формат) подписаны,
+поэтому клиент не может заказать произвольную нарезку. Готовые варианты
+хранятся на диске в кэше ограниченного объёма, при переполнении
+удаляются давно не запрошенные. Одновременные запросы одного варианта
+ждут единственную нарезку.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+RESIZE_SALT = 'posts.resize'
+RESIZE_MAX_SIZE: int = getattr(settings, 'RESIZE_MAX_SIZE', 2560)
+# Объём дискового кэша вариантов в байтах.
+RESIZE_CACHE_MAX_BYTES: int = getattr(
+    settings, 'RESIZE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+# После переполнения кэш очищается до этой доли объёма.
+RESIZE_CACHE_LOW_WATER = 0.9
+RESIZE_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+RESIZE_QUALITY: int = getattr(settings, 'IMAGE_QUALITY', 80)
+
+
+class InvalidVariant(ValueError):
+    """Подпись не сошлась или параметры варианта недопустимы."""
+
+
+def cache_dir() -> str:
+    return getattr(
+        settings, 'RESIZE_CACHE_DIR',
+        os.path.join(settings.MEDIA_ROOT, 'cache', 'resized'))
+
+
+def resize_url(post_id, width: int, height: int = 0, crop: bool = False,
+               fmt: str = 'webp') -> str:
+    """Подписанная ссылка на вариант картинки поста."""
+    token = signing.dumps(
+        [post_id, width, height, int(crop), fmt],
+        salt=RESIZE_SALT, compress=True)
+    return reverse('posts:resize_image', kwargs={'token': token})
+
+
+def load_variant(token: str):
+    """Параметры варианта из ссылки: (post_id, width, height, crop, fmt)."""
+    try:
+        post_id, width, height, crop, fmt = signing.loads(
+            token, salt=RESIZE_SALT)
+    except (signing.BadSignature, TypeError, ValueError) as error:
+        raise InvalidVariant(str(error)) from error
+    if fmt not in RESIZE_FORMATS:
+        raise InvalidVariant(f'Неизвестный формат {fmt}')
+    if not 0 < width <= RESIZE_MAX_SIZE or not 0 <= height <= RESIZE_MAX_SIZE:
+        raise InvalidVariant(f'Недопустимый размер {width}x{height}')
+    if crop and not height:
+        raise InvalidVariant('Для обрезки нужна высота')
+    return post_id, width, height, bool(crop), fmt
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Открытый файл path под замком, общим для процессов.
+
+    Без fcntl (Windows) замок не ставится, и процессы не согласуются.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        yield file
+
+
+class DiskLRUCache:
+    """Файловый кэш с вытеснением по времени последнего обращения.
+
+    Кэш общий у всех процессов сервера: нарезка варианта и учёт объёма
+    согласуются файловыми замками. Замок нарезки один на подкаталог,
+    чтобы файлы замков не копились. Занятый объём хранится в файле
+    .size рядом с вариантами.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def path(self, key: str, extension: str) -> str:
+        return os.path.join(cache_dir(), key[:2], f'{key}.{extension}')
+
+    def touch(self, path: str) -> bool:
+        """Отмечает обращение к файлу; False, если файла нет."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextmanager
+    def lock(self, key: str):
+        """Замок варианта: нарезку выполняет только первый запрос.
+
+        Потоки процесса ждут на своём замке, а не на файловом.
+        """
+        with self._lock:
+            lock, waiters = self._key_locks.get(key, (threading.Lock(), 0))
+            self._key_locks[key] = (lock, waiters + 1)
+        try:
+            with lock, _file_lock(
+                    os.path.join(cache_dir(), key[:2], '.lock')):
+                yield
+        finally:
+            with self._lock:
+                lock, waiters = self._key_locks[key]
+                if waiters == 1:
+                    del self._key_locks[key]
+                else:
+                    self._key_locks[key] = (lock, waiters - 1)
+
+    def store(self, path: str, content: bytes) -> None:
+        """Атомарно записывает файл и вытесняет старые при переполнении."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as file:
+            file.write(content)
+        os.replace(temporary, path)
+        with self._lock, _file_lock(
+                os.path.join(cache_dir(), '.size')) as size_file:
+            stored = size_file.read()
+            if stored:
+                size = int(stored) + len(content)
+            else:
+                size = sum(size for _, size, _ in self._entries())
+            if size > self.max_bytes:
+                size = self._evict()
+            size_file.seek(0)
+            size_file.truncate()
+            size_file.write(str(size).encode())
+
+    def _entries(self):
+        """Файлы кэша: (время обращения, размер, путь)."""
+        for root, _, files in os.walk(cache_dir()):
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self) -> int:
+        """Удаляет давно не запрошенные файлы, возвращает новый объём."""
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * RESIZE_CACHE_LOW_WATER
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+        return size
+
+
+disk_cache = DiskLRUCache(RESIZE_CACHE_MAX_BYTES)
+
+
+def _resize(source, width: int, height: int, crop: bool, fmt: str) -> bytes:
+    with Image.open(source) as image:
+        image.draft('RGB', (width, height or width))
+        image = ImageOps.exif_transpose(image)
+        if crop:
+            image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            image.thumbnail((width, height or RESIZE_MAX_SIZE), Image.LANCZOS)
+        pil_format = RESIZE_FORMATS[fmt][0]
+        if pil_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+        buffer = BytesIO()
+        image.save(buffer, pil_format, quality=RESIZE_QUALITY)
+        return buffer.getvalue()
+
+
+def variant_key(image_name: str, width, height, crop, fmt) -> str:
+    raw = f'{image_name}|{width}|{height}|{int(crop)}|{fmt}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get_variant(image, width: int, height: int, crop: bool, fmt: str):
+    """Путь к файлу варианта, при первом запросе он нарезается.
+
+    Имя картинки — хэш содержимого, поэтому смена картинки поста
+    даёт новый ключ, а не устаревший вариант.
+    """
+    key = variant_key(image.name, width, height, crop, fmt)
+    path = disk_cache.path(key, fmt)
+    if disk_cache.touch(path):
+        return key, path
+    with disk_cache.lock(key):
+        if not disk_cache.touch(path):
+            with image.storage.open(image.name) as source:
+                content = _resize(source, width, height, crop, fmt)
+            disk_cache.store(path, content)
+    return key, path
@@ -0,0 +1,165 @@
+"""Чтение постов с реплик и запись в основную базу.
+
+Запросы к моделям приложений из REPLICA_APPS читаются со случайной
+реплики из REPLICA_DATABASES, а записываются в default. Остальные
+модели, как и всё без реплик, роутер не трогает. Реплика отстаёт
+от основной базы, поэтому автор после публикации, комментария или
+подписки REPLICA_STICKY_SECONDS секунд читает из основной базы и сразу
+видит свои изменения.
+
+    DATABASES = {
+        'default': {...},
+        'replica': {..., 'TEST': {'MIRROR': 'default'}},
+    }
+    REPLICA_DATABASES = ['replica']
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from .sharding import (
+    is_sharded, post_shard, shard_for_author, sharding_enabled)
+
+
+REPLICA_DATABASES = tuple(getattr(settings, 'REPLICA_DATABASES', ()))
+REPLICA_APPS = frozenset(getattr(settings, 'REPLICA_APPS', ('posts',)))
+REPLICA_STICKY_SECONDS: int = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+PRIMARY_DATABASE = 'default'
+
+_state = threading.local()
+
+
+def use_primary(value: bool = True) -> None:
+    """Направляет чтение текущего потока в основную базу."""
+    _state.primary = value
+
+
+def reads_from_primary() -> bool:
+    return getattr(_state, 'primary', False)
+
+
+def _sticky_key(user_id) -> str:
+    return f'read-primary:{user_id}'
+
+
+def stick_to_primary(request) -> None:
+    """Закрепляет автора изменения за основной базой.
+
+    До конца запроса и ещё REPLICA_STICKY_SECONDS секунд его чтения
+    не уходят на реплики, которые могли не получить изменение.
+    """
+    if not REPLICA_DATABASES:
+        return
+    use_primary()
+    if request.user.is_authenticated:
+        cache.set(
+            _sticky_key(request.user.pk), True, REPLICA_STICKY_SECONDS)
+
+
+def is_stuck_to_primary(user) -> bool:
+    return user.is_authenticated and bool(cache.get(_sticky_key(user.pk)))
+
+
+class ReplicaRouter:
+    """Роутер: чтение постов с реплик, запись в основную базу."""
+
+    def _replicated(self, model) -> bool:
+        return (
+            bool(REPLICA_DATABASES)
+            and model._meta.app_label in REPLICA_APPS
+        )
+
+    def db_for_read(self, model, **hints):
+        if not self._replicated(model):
+            return None
+        if reads_from_primary():
+            return PRIMARY_DATABASE
+        return random.choice(REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        # Остальные модели пишутся туда, куда их направил вызов using().
+        if not self._replicated(model):
+            return None
+        return PRIMARY_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же строки, что и основная база.
+        databases = {PRIMARY_DATABASE, *REPLICA_DATABASES}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными из основной базы.
+        return db not in REPLICA_DATABASES
+
+
+class ShardRouter:
+    """Роутер шардов: посты и комментарии — в базе шарда автора.
+
+    Без объекта-подсказки шард неизвестен, и такие запросы должны
+    указывать базу сами через using(); связанные с постом пользователи
+    и группы читаются из default.
+    """
+
+    def _shard_of(self, model, instance):
+        """Шард объекта model, связанного с instance, если он известен."""
+        name = instance._meta.label_lower
+        if name == 'posts.post':
+            return shard_for_author(instance.author_id)
+        if name == 'posts.comment':
+            return self._comment_shard(instance)
+        if (name == settings.AUTH_USER_MODEL.lower()
+                and model._meta.model_name == 'post'):
+            # Посты пользователя лежат в его шарде, комментарии — нет.
+            return shard_for_author(instance.pk)
+        return None
+
+    def _comment_shard(self, comment):
+        if not comment._state.adding and comment._state.db:
+            return comment._state.db
+        # У нового комментария _state.db мог выставить автор из default.
+        post = comment._state.fields_cache.get('post')
+        if post is not None:
+            return shard_for_author(post.author_id)
+        return post_shard(comment.post_id)
+
+    def _route(self, model, instance):
+        if not sharding_enabled() or instance is None:
+            return None
+        if is_sharded(model):
+            return self._shard_of(model, instance)
+        if is_sharded(instance._meta.model):
+            return PRIMARY_DATABASE
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding_enabled() and (is_sharded(obj1._meta.model)
+                                   or is_sharded(obj2._meta.model)):
+            return True
+        return None
+
+
+class ReplicaStickinessMiddleware:
+    """Закрепляет за основной базой запросы недавних авторов изменений.
+
+    Подключается после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        use_primary(
+            bool(REPLICA_DATABASES) and is_stuck_to_primary(request.user))
+        try:
+            return self.get_response(request)
+        finally:
+            use_primary(False)
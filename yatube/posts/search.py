@@ -0,0 +1,266 @@
+"""Полнотекстовый поиск постов на SQLite FTS5.
+
+В индекс попадают не слова, а их основы после стемминга, поэтому
+«котами» находится по запросу «кот». Индекс обновляется сигналами
+при сохранении и удалении поста.
+"""
+import base64
+import binascii
+import re
+
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .sharding import posts_by_ids
+from .utils import CursorPaginator
+
+
+FTS_TABLE = 'posts_post_fts'
+# Сколько слов текста показывать в выдержке с подсветкой.
+SNIPPET_WORDS: int = 30
+
+WORD_RE = re.compile(r'\w+')
+VOWELS = 'аеиоуыэюя'
+
+# Окончания стеммера Snowball для русского языка. Для окончаний
+# с флагом True перед ними в слове должна стоять «а» или «я».
+PERFECTIVE_GERUND = (
+    [(ending, True) for ending in ('в', 'вши', 'вшись')]
+    + [(ending, False) for ending in ('ив', 'ивши', 'ившись',
+                                      'ыв', 'ывши', 'ывшись')]
+)
+ADJECTIVE = [(ending, False) for ending in (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+)]
+PARTICIPLE = (
+    [(ending, True) for ending in ('ем', 'нн', 'вш', 'ющ', 'щ')]
+    + [(ending, False) for ending in ('ивш', 'ывш', 'ующ')]
+)
+REFLEXIVE = [(ending, False) for ending in ('ся', 'сь')]
+VERB = (
+    [(ending, True) for ending in (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    )]
+    + [(ending, False) for ending in (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    )]
+)
+NOUN = [(ending, False) for ending in (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+)]
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+# Служебные слова запроса, которые не сужают поиск.
+STOP_WORDS = frozenset((
+    'а', 'без', 'в', 'во', 'да', 'для', 'до', 'же', 'за', 'и', 'из', 'или',
+    'к', 'ко', 'ли', 'на', 'не', 'ни', 'но', 'о', 'об', 'от', 'по', 'под',
+    'при', 'с', 'со', 'то', 'у',
+))
+
+
+def _strip(word: str, endings):
+    """Отрезает самое длинное окончание из endings или возвращает None."""
+    for ending, after_a in sorted(endings, key=lambda e: -len(e[0])):
+        if word.endswith(ending):
+            base = word[:-len(ending)]
+            if after_a and not base.endswith(('а', 'я')):
+                return None
+            return base
+    return None
+
+
+def _region_after(word: str, start: int) -> int:
+    """Начало области после первой пары «гласная + согласная»."""
+    for i in range(start + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            return i + 1
+    return len(word)
+
+
+def _strip_inflection(rv: str) -> str:
+    """Шаг 1: деепричастие либо возвратность и окончание."""
+    stripped = _strip(rv, PERFECTIVE_GERUND)
+    if stripped is not None:
+        return stripped
+    reflexive = _strip(rv, REFLEXIVE)
+    if reflexive is not None:
+        rv = reflexive
+    adjective = _strip(rv, ADJECTIVE)
+    if adjective is not None:
+        participle = _strip(adjective, PARTICIPLE)
+        return adjective if participle is None else participle
+    for endings in (VERB, NOUN):
+        stripped = _strip(rv, endings)
+        if stripped is not None:
+            return stripped
+    return rv
+
+
+def _tidy_up(rv: str) -> str:
+    """Шаг 4: превосходная степень, удвоенная «н» и мягкий знак."""
+    superlative = _strip(rv, [(ending, False) for ending in SUPERLATIVE])
+    if superlative is not None:
+        rv = superlative
+    elif rv.endswith('ь'):
+        return rv[:-1]
+    return rv[:-1] if rv.endswith('нн') else rv
+
+
+def stem(word: str) -> str:
+    """Основа русского слова по алгоритму Snowball."""
+    word = word.lower().replace('ё', 'е')
+    rv_start = next(
+        (i + 1 for i, char in enumerate(word) if char in VOWELS), len(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+    r2_start = _region_after(word, _region_after(word, 0)) - rv_start
+
+    rv = _strip_inflection(rv)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    for ending in DERIVATIONAL:
+        if rv.endswith(ending) and len(rv) - len(ending) >= r2_start:
+            rv = rv[:-len(ending)]
+            break
+    return prefix + _tidy_up(rv)
+
+
+def index_text(text: str) -> str:
+    """Текст поста в виде основ слов для индекса."""
+    return ' '.join(stem(word) for word in WORD_RE.findall(text))
+
+
+def query_stems(query: str) -> set:
+    """Основы значимых слов запроса."""
+    return {
+        stem(word) for word in WORD_RE.findall(query.lower())
+        if word not in STOP_WORDS
+    } - {''}
+
+
+def match_expression(query: str) -> str:
+    """Выражение MATCH: все основы запроса как префиксы."""
+    return ' '.join(f'"{word}"*' for word in sorted(query_stems(query)))
+
+
+def search_enabled() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def index_posts(rows) -> None:
+    """Заменяет в индексе записи постов, rows — пары (id, текст)."""
+    if not search_enabled():
+        return
+    rows = [(pk, index_text(text)) for pk, text in rows]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(pk,) for pk, _ in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, stems) VALUES (%s, %s)', rows)
+
+
+def unindex_post(post_id) -> None:
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def search_ids(match: str, cursor=None, backwards=False, offset=0,
+               limit=None):
+    """Пары (релевантность, id) найденных постов, лучшие первыми.
+
+    Курсор — пара (релевантность, id) последней выданной записи.
+    При backwards=True записи берутся перед курсором в обратном порядке.
+    """
+    score = f'bm25({FTS_TABLE})'
+    sql = (
+        f'SELECT {score}, rowid FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s'
+    )
+    params = [match]
+    if cursor is not None:
+        operator = '<' if backwards else '>'
+        sql += (
+            f' AND ({score} {operator} %s'
+            f' OR ({score} = %s AND rowid {operator} %s))'
+        )
+        params += [cursor[0], cursor[0], cursor[1]]
+    order = 'DESC' if backwards else 'ASC'
+    sql += f' ORDER BY 1 {order}, rowid {order} LIMIT %s OFFSET %s'
+    params += [-1 if limit is None else limit, offset]
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        return db_cursor.fetchall()
+
+
+def highlight(text: str, query: str) -> str:
+    """Выдержка из текста вокруг первого совпадения с подсветкой слов."""
+    stems = query_stems(query)
+    words = list(WORD_RE.finditer(text))
+    matched = [
+        any(stem(word.group()).startswith(prefix) for prefix in stems)
+        for word in words
+    ]
+    if not words:
+        return escape(text)
+    first = matched.index(True) if any(matched) else 0
+    start = max(0, first - SNIPPET_WORDS // 3)
+    end = min(len(words), start + SNIPPET_WORDS)
+    parts = ['…'] if start > 0 else []
+    position = words[start].start() if start > 0 else 0
+    for word, is_match in zip(words[start:end], matched[start:end]):
+        parts.append(escape(text[position:word.start()]))
+        if is_match:
+            parts.append(f'<mark>{escape(word.group())}</mark>')
+        else:
+            parts.append(escape(word.group()))
+        position = word.end()
+    if end < len(words):
+        parts.append('…')
+    else:
+        parts.append(escape(text[position:]))
+    return mark_safe(''.join(parts))
+
+
+class SearchPaginator(CursorPaginator):
+    """Паджинатор выдачи поиска по ключу (релевантность, id)."""
+
+    def __init__(self, query: str, per_page, with_count=False, **kwargs):
+        Paginator.__init__(self, [], per_page, **kwargs)
+        self.match = match_expression(query)
+        self.with_count = False
+
+    def encode_key(self, key) -> str:
+        raw = f'{key[0]!r}|{key[1]}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_key(self, token: str):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            score, pk = raw.rsplit('|', 1)
+            return float(score), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+
+    def _fetch(self, cursor=None, backwards=False, offset=0, limit=None):
+        if not self.match:
+            return []
+        if limit is None:
+            limit = self.per_page + 1
+        rows = search_ids(self.match, cursor, backwards, offset, limit)
+        posts = posts_by_ids(pk for _, pk in rows)
+        return [
+            ((score, pk), posts[pk]) for score, pk in rows if pk in posts
+        ]
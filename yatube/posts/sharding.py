@@ -0,0 +1,124 @@
+"""Шардирование постов по автору.
+
+Посты и комментарии к ним хранятся в базе шарда автора: алиас из
+POST_SHARDS с номером author_id % len(POST_SHARDS). Пользователи,
+группы, подписки, материализованные ленты и справочник PostLocation
+остаются в default. id поста выдаёт справочник, поэтому он уникален
+во всех шардах, а по id находится автор и, значит, шард.
+
+Без POST_SHARDS всё хранится в default, как раньше.
+
+    DATABASES = {'default': {...}, 'posts_1': {...}, 'posts_2': {...}}
+    POST_SHARDS = ['posts_1', 'posts_2']
+
+Ссылки между базами не проверяются SQLite, поэтому при включённом
+шардировании проверка внешних ключей отключается. Админка показывает
+только посты из default.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import models
+
+
+POST_SHARDS = tuple(getattr(settings, 'POST_SHARDS', ()))
+# Модели приложения posts, строки которых лежат в шардах.
+SHARDED_MODELS = frozenset(('post', 'comment'))
+
+
+def sharding_enabled() -> bool:
+    return bool(POST_SHARDS)
+
+
+def shard_for_author(author_id):
+    """Алиас базы с постами автора; None без шардирования."""
+    if not POST_SHARDS:
+        return None
+    return POST_SHARDS[author_id % len(POST_SHARDS)]
+
+
+def shards() -> list:
+    """Базы, которые обходит лента; [None] — база по умолчанию."""
+    return list(POST_SHARDS) or [None]
+
+
+def group_by_shard(author_ids) -> dict:
+    """Алиас шарда → id авторов, чьи посты в нём лежат."""
+    grouped = defaultdict(list)
+    for author_id in author_ids:
+        grouped[shard_for_author(author_id)].append(author_id)
+    return dict(grouped)
+
+
+def is_sharded(model) -> bool:
+    return (
+        model._meta.app_label == 'posts'
+        and model._meta.model_name in SHARDED_MODELS
+    )
+
+
+def with_related(queryset, *fields):
+    """Подтягивает связанные объекты одним JOIN или, в шардах, отдельно.
+
+    Автор и группа поста лежат в другой базе, поэтому при шардировании
+    они догружаются prefetch_related из default.
+    """
+    if POST_SHARDS:
+        return queryset.prefetch_related(*fields)
+    return queryset.select_related(*fields)
+
+
+def post_shard(post_id):
+    """Алиас базы поста по справочнику; None без шардирования."""
+    if not POST_SHARDS:
+        return None
+    from .models import PostLocation
+    author_id = (
+        PostLocation.objects.filter(pk=post_id)
+        .values_list('author_id', flat=True)
+        .first()
+    )
+    if author_id is None:
+        # Поста нет: запрос к любому шарду вернёт 404.
+        return POST_SHARDS[0]
+    return shard_for_author(author_id)
+
+
+def posts_by_ids(ids, authors=None) -> dict:
+    """Посты для ленты по id из всех шардов: id → пост.
+
+    authors — id поста → id автора, если уже известны; иначе авторы
+    берутся из справочника одним запросом.
+    """
+    from .models import Post, PostLocation
+    ids = list(ids)
+    if not POST_SHARDS:
+        return Post.objects.for_feed().in_bulk(ids)
+    if authors is None:
+        authors = dict(
+            PostLocation.objects.filter(pk__in=ids)
+            .values_list('pk', 'author_id')
+        )
+    grouped = defaultdict(list)
+    for post_id, author_id in authors.items():
+        grouped[shard_for_author(author_id)].append(post_id)
+    posts = {}
+    for alias, post_ids in grouped.items():
+        posts.update(
+            Post.objects.using(alias).for_feed().in_bulk(post_ids))
+    return posts
+
+
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet моделей, которые хранятся в шардах."""
+
+    def create(self, **kwargs):
+        """Создаёт объект в базе, которую роутер выбирает по нему самому.
+
+        Стандартный create спрашивает роутер без объекта, и пост без
+        явного using попал бы в default, а не в шард автора.
+        """
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
@@ -0,0 +1,269 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+from django.db import transaction
+from .models import (
+    Post, PostLocation, Group, Comment, Follow, StoredImage, TimelineEntry,
+    UserStats)
+from .cache import bump_feed_version, bump_post_feeds
+from .db import configure_connection
+from .feeds import (
+    backfill_former_celebrity, backfill_timeline, fan_out_post,
+    prune_timeline)
+from .search import index_posts, unindex_post
+from .sharding import shard_for_author, sharding_enabled, shards
+from .storage import post_image_storage
+from .thumbnails import delete_image
+
+
+User = get_user_model()
+
+
+@receiver(connection_created)
+def configure_database_connection(sender, connection, **kwargs):
+    configure_connection(connection)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    """Заводит счётчики новому пользователю."""
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.bump(instance.author_id, 'posts_count', 1)
+        fan_out_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_created_comment(sender, instance, created, raw=False,
+                          using=None, **kwargs):
+    if created and not raw:
+        Post.objects.using(using).bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, using=None, **kwargs):
+    Post.objects.using(using).bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_created_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.bump(instance.author_id, 'followers_count', 1)
+        UserStats.objects.bump(instance.user_id, 'following_count', 1)
+        backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    UserStats.objects.bump(instance.author_id, 'followers_count', -1)
+    UserStats.objects.bump(instance.user_id, 'following_count', -1)
+    prune_timeline(instance.user_id, instance.author_id)
+    backfill_former_celebrity(instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, raw=False, using=None,
+                           **kwargs):
+    """Запоминает прежние группу и картинку поста.
+
+    Ленту прежней группы нужно сбросить, а прежний файл картинки
+    освободить.
+    """
+    if instance.pk and not raw:
+        previous = (
+            Post.objects.using(using).filter(pk=instance.pk)
+            .values('group_id', 'image')
+            .first()
+        )
+        if previous is not None:
+            instance._previous_group_ids = {previous['group_id']}
+            instance._previous_image = previous['image']
+
+
+@receiver(pre_save, sender=Post)
+def assign_post_location(sender, instance, raw=False, **kwargs):
+    """Выдаёт новому посту id из справочника шардов."""
+    if sharding_enabled() and instance.pk is None and not raw:
+        instance.pk = PostLocation.objects.create(
+            author_id=instance.author_id).pk
+
+
+@receiver(post_delete, sender=Post)
+def delete_post_references(sender, instance, **kwargs):
+    """Справочник и ленты подписок лежат в default.
+
+    Каскадное удаление поста из шарда до них не доходит.
+    """
+    if sharding_enabled():
+        PostLocation.objects.filter(pk=instance.pk).delete()
+        TimelineEntry.objects.filter(post_id=instance.pk).delete()
+
+
+def _other_shards(using) -> list:
+    """Шарды, куда не дойдёт каскадное удаление строки из базы using."""
+    if not sharding_enabled():
+        return []
+    return [alias for alias in shards() if alias != using]
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_user_content(sender, instance, using=None, **kwargs):
+    """Удаляет посты и комментарии пользователя из всех шардов."""
+    for alias in _other_shards(using):
+        Comment.objects.using(alias).filter(author_id=instance.pk).delete()
+        Post.objects.using(alias).filter(author_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Group)
+def delete_sharded_group_posts(sender, instance, using=None, **kwargs):
+    """Удаляет посты группы из всех шардов."""
+    for alias in _other_shards(using):
+        Post.objects.using(alias).filter(group_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_post_feeds(
+            instance, getattr(instance, '_previous_group_ids', ()))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, raw=False, using=None,
+                             **kwargs):
+    """Число комментариев выводится в карточке поста во всех лентах."""
+    if raw:
+        return
+    post = (
+        Post.objects.using(using).filter(pk=instance.post_id)
+        .only('author_id', 'group_id')
+        .first()
+    )
+    if post is not None:
+        bump_post_feeds(post)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_author_profile(sender, instance, raw=False, **kwargs):
+    """Профиль выводит число подписчиков и кнопку подписки."""
+    if not raw:
+        bump_feed_version('profile', instance.author_id)
+
+
+@receiver(post_save, sender=Group)
+def touch_group_posts(sender, instance, created, raw=False, **kwargs):
+    """Название группы выводится в карточках её постов.
+
+    Кроме главной и ленты группы, карточки лежат в профилях авторов.
+    При удалении группы профили сбрасывают сигналы удалённых постов.
+    """
+    if created or raw:
+        return
+    author_ids = set()
+    for alias in shards():
+        posts = Post.objects.using(alias).filter(group_id=instance.pk)
+        posts.touch()
+        author_ids.update(
+            posts.values_list('author_id', flat=True).distinct())
+    for author_id in author_ids:
+        bump_feed_version('profile', author_id)
+
+
+@receiver(post_save, sender=User)
+def touch_author_posts(sender, instance, created, raw=False,
+                       update_fields=None, **kwargs):
+    """Имя автора выводится в карточках его постов во всех лентах.
+
+    Вход пользователя сохраняет только last_login и ленты не трогает.
+    """
+    if created or raw or update_fields == {'last_login'}:
+        return
+    posts = Post.objects.using(shard_for_author(instance.pk)).filter(
+        author_id=instance.pk)
+    posts.touch()
+    bump_feed_version('index')
+    bump_feed_version('profile', instance.pk)
+    group_ids = (
+        posts.filter(group_id__isnull=False)
+        .values_list('group_id', flat=True)
+        .distinct()
+    )
+    for group_id in group_ids:
+        bump_feed_version('group', group_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_feed_version('index')
+        bump_feed_version('group', instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    """Переиндексирует текст поста для поиска."""
+    index_posts([(instance.pk, instance.text)])
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_index(sender, instance, **kwargs):
+    unindex_post(instance.pk)
+
+
+def release_image(name: str) -> None:
+    """Удаляет файл, когда на него не ссылается ни один пост.
+
+    Файлы, загруженные до хранения по хэшу, не трогаем.
+    """
+    released = StoredImage.objects.release(name)
+    if released and post_image_storage.is_hashed(name):
+        transaction.on_commit(lambda: delete_unreferenced_image(name))
+
+
+def delete_unreferenced_image(name: str) -> None:
+    """Удаляет файл, если до фиксации его не взял другой пост.
+
+    Параллельная загрузка того же содержимого не пишет файл заново,
+    а только добавляет ссылку, поэтому ссылки проверяются ещё раз.
+    """
+    with transaction.atomic():
+        referenced = (
+            StoredImage.objects.select_for_update()
+            .filter(pk=name, references__gt=0)
+            .exists()
+        )
+        if not referenced:
+            delete_image(name)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_image', '')
+    current = instance.image.name or ''
+    if previous != current:
+        StoredImage.objects.acquire(current)
+        release_image(previous)
+    instance._previous_image = current
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_post_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
@@ -0,0 +1,261 @@
+"""Кэш в файле SQLite, общий для всех процессов хоста.
+
+LocMemCache у каждого воркера свой: фрагменты дублируются в памяти,
+а сброс версии ленты в одном воркере не виден остальным. Этот бэкенд
+хранит записи в одном файле в режиме WAL, поэтому читатели не мешают
+друг другу, а запись идёт короткими транзакциями. Объём ограничен
+числом записей и суммарным размером: при превышении удаляются давно
+не читавшиеся записи.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'posts.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'MAX_BYTES': 256 * 2 ** 20},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+# Сколько секунд не обновлять время чтения записи: чтение горячих
+# ключей не превращается в запись на каждом обращении.
+ACCESS_RESOLUTION: float = 1.0
+# Ограничение SQLite на число параметров запроса.
+MAX_QUERY_PARAMS = 900
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    # Объём и число записей ведут триггеры, чтобы не считать их
+    # по всей таблице при каждой записи.
+    '''CREATE TABLE IF NOT EXISTS cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL,
+        bytes INTEGER NOT NULL
+    )''',
+    'INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0)',
+    '''CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries + 1, bytes = bytes + new.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_update
+    AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_stats SET bytes = bytes - old.size + new.size;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache
+    BEGIN
+        UPDATE cache_stats
+        SET entries = entries - 1, bytes = bytes - old.size;
+    END''',
+)
+
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, accessed, size) '
+    'VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+    'expires = excluded.expires, accessed = excluded.accessed, '
+    'size = excluded.size'
+)
+
+
+def _chunks(items, size=MAX_QUERY_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    """Кэш Django в файле SQLite с вытеснением по давности чтения.
+
+    Кроме стандартных MAX_ENTRIES и CULL_FREQUENCY понимает опцию
+    MAX_BYTES — предельный суммарный размер значений.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._max_bytes = int(options.get('MAX_BYTES', 64 * 2 ** 20))
+        self._local = threading.local()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока; после fork открывается заново."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None,
+                check_same_thread=False)
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            with self._transaction():
+                for statement in SCHEMA:
+                    connection.execute(statement)
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        """Транзакция с блокировкой записи с самого начала.
+
+        BEGIN IMMEDIATE не даёт другим процессам вклиниться между
+        чтением и записью.
+        """
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version=None) -> str:
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _row(self, key, value, timeout, now):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        return key, data, expires, now, len(data)
+
+    def _read(self, keys) -> dict:
+        """Неистёкшие значения по ключам с обновлением времени чтения."""
+        now = time.time()
+        found = {}
+        for chunk in _chunks(keys):
+            placeholders = ', '.join('?' * len(chunk))
+            found.update(
+                (key, data) for key, data in self._connection.execute(
+                    f'SELECT key, value FROM cache '
+                    f'WHERE key IN ({placeholders}) '
+                    f'AND (expires IS NULL OR expires > ?)',
+                    [*chunk, now])
+            )
+            self._connection.execute(
+                f'UPDATE cache SET accessed = ? '
+                f'WHERE key IN ({placeholders}) AND accessed < ?',
+                [now, *chunk, now - ACCESS_RESOLUTION])
+        return {key: pickle.loads(data) for key, data in found.items()}
+
+    def _cull(self) -> None:
+        """Удаляет истёкшие и давно не читавшиеся записи сверх лимитов."""
+        connection = self._connection
+        entries, size = connection.execute(
+            'SELECT entries, bytes FROM cache_stats').fetchone()
+        if entries <= self._max_entries and size <= self._max_bytes:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', [time.time()])
+        # Как и в стандартных бэкендах, освобождается 1/CULL_FREQUENCY.
+        keep = 1 - 1 / max(self._cull_frequency, 1)
+        connection.execute(
+            '''DELETE FROM cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key,
+                        ROW_NUMBER() OVER recent AS position,
+                        SUM(size) OVER recent AS kept
+                    FROM cache
+                    WINDOW recent AS (ORDER BY accessed DESC)
+                ) WHERE position > ? OR kept > ?
+            )''',
+            [int(self._max_entries * keep), int(self._max_bytes * keep)])
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._read([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        values = self._read(list(keys))
+        return {keys[key]: value for key, value in values.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        row = self._row(self._key(key, version), value, timeout, time.time())
+        with self._transaction() as connection:
+            connection.execute(UPSERT, row)
+            self._cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [
+            self._row(self._key(key, version), value, timeout, now)
+            for key, value in data.items()
+        ]
+        with self._transaction() as connection:
+            connection.executemany(UPSERT, rows)
+            self._cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Записывает значение, только если ключа нет или он истёк."""
+        now = time.time()
+        row = self._row(self._key(key, version), value, timeout, now)
+        with self._transaction() as connection:
+            added = connection.execute(
+                UPSERT + ' WHERE cache.expires <= ?', [*row, now]).rowcount
+            self._cull()
+        return added == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            value = self._read([key]).get(key)
+            if value is None:
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                [data, len(data), key])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        updated = self._connection.execute(
+            'UPDATE cache SET expires = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            [self.get_backend_timeout(timeout), self._key(key, version), now],
+        ).rowcount
+        return updated == 1
+
+    def has_key(self, key, version=None):
+        return self._connection.execute(
+            'SELECT 1 FROM cache '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            [self._key(key, version), time.time()],
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        deleted = self._connection.execute(
+            'DELETE FROM cache WHERE key = ?',
+            [self._key(key, version)]).rowcount
+        return deleted == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            for chunk in _chunks(keys):
+                placeholders = ', '.join('?' * len(chunk))
+                connection.execute(
+                    f'DELETE FROM cache WHERE key IN ({placeholders})', chunk)
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
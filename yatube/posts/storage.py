@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class HashedMediaStorage(FileSystemStorage):
+    """Хранилище, где имя файла — хэш его содержимого.
+
+    Одинаковые файлы получают одно имя и записываются один раз.
+    Миниатюры sorl строятся от имени исходника, поэтому тоже общие.
+    """
+
+    HASHED_NAME_RE = re.compile(r'^(?:.+/)?([0-9a-f]{2})/\1[0-9a-f]{62}\.\w+$')
+
+    def is_hashed(self, name: str) -> bool:
+        """Файл записан этим хранилищем, а не загружен до него."""
+        return bool(self.HASHED_NAME_RE.match(name))
+
+    def hashed_name(self, name: str, content) -> str:
+        """posts/photo.webp → posts/ab/abcdef….webp"""
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, hexdigest[:2], hexdigest + extension
+        ).replace('\\', '/')
+
+    def get_available_name(self, name, max_length=None):
+        # Имя по содержимому уникально, подбирать свободное не нужно.
+        # FileSystemStorage._save зовёт этот метод при FileExistsError:
+        # тот же файл только что записала параллельная загрузка.
+        if self.is_hashed(name) and self.exists(name):
+            raise _AlreadyStored(name)
+        return name
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        try:
+            return super()._save(name, content)
+        except _AlreadyStored:
+            return name
+
+
+class _AlreadyStored(Exception):
+    """Файл с таким содержимым уже записан."""
+
+
+post_image_storage = HashedMediaStorage()
@@ -0,0 +1,41 @@
+from django import template
+from django.template.context import RenderContext
+from ..cache import stale_while_revalidate
+
+
+register = template.Library()
+
+
+class StaleCacheNode(template.Node):
+    def __init__(self, nodelist, slot, tag):
+        self.nodelist = nodelist
+        self.slot = slot
+        self.tag = tag
+
+    def render(self, context):
+        slot = self.slot.resolve(context)
+        tag = self.tag.resolve(context)
+        # Фрагмент может отрисовываться в фоне, пока запрос рендерит
+        # остальную страницу, поэтому ему нужен собственный контекст.
+        snapshot = context.new(context.flatten())
+        snapshot.render_context = RenderContext()
+        return stale_while_revalidate(
+            slot, tag, lambda: self.nodelist.render(snapshot))
+
+
+@register.tag
+def stale_cache(parser, token):
+    """Фрагмент с кэшем stale-while-revalidate.
+
+    {% stale_cache slot tag %} ... {% endstale_cache %}: slot — место
+    фрагмента в кэше, tag — метка актуальной версии данных.
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает два аргумента: слот и метку версии.')
+    nodelist = parser.parse(('endstale_cache',))
+    parser.delete_first_token()
+    return StaleCacheNode(
+        nodelist, parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]))
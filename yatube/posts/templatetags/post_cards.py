@@ -0,0 +1,54 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from ..cache import FEED_CACHE_TIMEOUT
+from ..thumbnails import prefetch_srcsets
+
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+# Сколько первых карточек страницы видно без прокрутки: их картинки
+# грузятся сразу, остальные — лениво.
+EAGER_CARDS: int = 2
+
+
+def card_cache_key(post, loading: str = 'lazy') -> str:
+    """Ключ карточки меняется вместе с датой изменения поста."""
+    return f'post-card:{post.pk}:{post.updated.timestamp()}:{loading}'
+
+
+def _loading(position: int) -> str:
+    return 'eager' if position < EAGER_CARDS else 'lazy'
+
+
+@register.simple_tag
+def post_cards(posts):
+    """HTML карточек постов страницы.
+
+    Закэшированные карточки достаются одним get_many,
+    отрисовываются только отсутствующие. Миниатюры для них
+    заранее достаются одним пакетным чтением.
+    """
+    posts = list(posts)
+    keys = [
+        card_cache_key(post, _loading(position))
+        for position, post in enumerate(posts)
+    ]
+    cards = cache.get_many(keys)
+    to_render = [
+        (key, position, post)
+        for position, (key, post) in enumerate(zip(keys, posts))
+        if key not in cards
+    ]
+    prefetch_srcsets(post for _, _, post in to_render)
+    missing = {
+        key: render_to_string(
+            CARD_TEMPLATE, {'post': post, 'loading': _loading(position)})
+        for key, position, post in to_render
+    }
+    if missing:
+        cache.set_many(missing, FEED_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,28 @@
+from django import template
+from ..thumbnails import THUMBNAIL_SIZES, THUMBNAIL_SIZES_ATTR, ready_srcset
+
+
+register = template.Library()
+
+# Размер кадра самой широкой миниатюры: его резервирует разметка.
+FRAME_WIDTH, FRAME_HEIGHT = (
+    int(side) for side in THUMBNAIL_SIZES[-1][0].split('x'))
+
+
+@register.simple_tag
+def post_srcset(post):
+    """Размер кадра и, если миниатюры готовы, src, srcset и sizes."""
+    image = {'width': FRAME_WIDTH, 'height': FRAME_HEIGHT}
+    thumbnails = ready_srcset(post)
+    if thumbnails:
+        image.update(
+            src=thumbnails[-1].url,
+            srcset=', '.join(
+                f'{thumbnail.url} {thumbnail.width}w'
+                for thumbnail in thumbnails
+            ),
+            sizes=THUMBNAIL_SIZES_ATTR,
+            width=thumbnails[-1].width,
+            height=thumbnails[-1].height,
+        )
+    return image
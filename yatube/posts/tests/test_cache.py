@@ -0,0 +1,108 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from .. import cache as feed_cache
+from ..cache import stale_while_revalidate
+from ..models import Post
+
+
+User = get_user_model()
+
+
+class StaleWhileRevalidateTest(TestCase):
+    """Фрагмент пересчитывает один запрос, остальные получают копию."""
+
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(return_value='new')
+
+    def store(self, tag='v1', value='old', refresh_in=60):
+        stale_while_revalidate(
+            'slot', tag, lambda: value, soft_timeout=refresh_in)
+
+    def hold_lock(self):
+        cache.add(feed_cache._lock_key('slot'), 1)
+
+    def test_fresh_value_not_recomputed(self):
+        self.store()
+        value = stale_while_revalidate('slot', 'v1', self.compute)
+        self.assertEqual(value, 'old')
+        self.compute.assert_not_called()
+
+    def test_lock_holder_refreshes_stale_value(self):
+        """Новая версия данных и истёкший срок свежести."""
+        for tag, refresh_in in (('v2', 60), ('v1', -1)):
+            with self.subTest(tag=tag, refresh_in=refresh_in):
+                self.store(refresh_in=refresh_in)
+                value = stale_while_revalidate('slot', tag, self.compute)
+                self.assertEqual(value, 'new')
+                self.assertIsNone(cache.get(feed_cache._lock_key('slot')))
+
+    def test_stale_value_served_while_locked(self):
+        self.store(refresh_in=-1)
+        self.hold_lock()
+        value = stale_while_revalidate('slot', 'v1', self.compute)
+        self.assertEqual(value, 'old')
+        self.compute.assert_not_called()
+
+    @mock.patch.object(feed_cache, 'FEED_LOCK_WAIT', 0.1)
+    def test_other_version_never_served(self):
+        """После записи прежний фрагмент не отдаётся и под блокировкой."""
+        self.store()
+        self.hold_lock()
+        value = stale_while_revalidate('slot', 'v2', self.compute)
+        self.assertEqual(value, 'new')
+
+    @mock.patch.object(feed_cache, 'FEED_LOCK_WAIT', 0.1)
+    def test_cold_miss_computed_after_wait(self):
+        self.hold_lock()
+        value = stale_while_revalidate('slot', 'v1', self.compute)
+        self.assertEqual(value, 'new')
+        self.assertEqual(cache.get(feed_cache._lock_key('slot')), 1)
+
+    @mock.patch.object(feed_cache, 'FEED_REFRESH_WORKERS', 1)
+    def test_background_refresh(self):
+        self.store(refresh_in=-1)
+        with mock.patch.object(feed_cache, '_get_executor') as executor:
+            value = stale_while_revalidate('slot', 'v1', self.compute)
+        self.assertEqual(value, 'old')
+        executor.return_value.submit.assert_called_once()
+        refresh, *args = executor.return_value.submit.call_args[0]
+        refresh(*args)
+        self.assertEqual(
+            stale_while_revalidate('slot', 'v1', mock.Mock()), 'new')
+
+    @mock.patch.object(feed_cache, 'FEED_REFRESH_WORKERS', 1)
+    def test_new_version_computed_inline(self):
+        self.store()
+        with mock.patch.object(feed_cache, '_get_executor') as executor:
+            value = stale_while_revalidate('slot', 'v2', self.compute)
+        self.assertEqual(value, 'new')
+        executor.assert_not_called()
+
+
+@mock.patch.object(feed_cache, 'FEED_REFRESH_WORKERS', 2)
+class BackgroundRefreshFeedTest(TestCase):
+    """С фоновым обновлением автор сразу видит свой новый пост."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        Post.objects.create(text='Old post', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def test_profile_after_create_shows_new_post(self):
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        self.client.get(url)
+        response = self.client.post(
+            reverse('posts:create_post'), {'text': 'Fresh post'},
+            follow=True)
+        self.assertContains(response, 'Fresh post')
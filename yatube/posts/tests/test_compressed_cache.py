@@ -0,0 +1,62 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.utils.safestring import SafeString, mark_safe
+from ..compressed_cache import CompressedCache
+
+
+LOCMEM = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+
+class CompressedCacheTest(TestCase):
+    """Большие значения хранятся сжатыми и читаются без изменений."""
+
+    def setUp(self):
+        self.cache = CompressedCache('', {'OPTIONS': {
+            'CACHE': dict(LOCMEM, LOCATION='compressed-cache-test'),
+            'MIN_SIZE': 100,
+        }})
+        self.cache.clear()
+        self.fragment = mark_safe('<article>Пост</article>' * 100)
+
+    def test_values_round_trip(self):
+        values = {
+            'text': 'Пост',
+            'fragment': self.fragment,
+            'bytes': b'\x00data',
+            'entry': ('tag', 1.5, self.fragment),
+            'counter': 1,
+        }
+        for key, value in values.items():
+            with self.subTest(key=key):
+                self.cache.set(key, value)
+                self.assertEqual(self.cache.get(key), value)
+        self.assertIsInstance(self.cache.get('fragment'), SafeString)
+        self.assertEqual(self.cache.incr('counter'), 2)
+
+    def test_large_value_stored_compressed(self):
+        self.cache.set('post-card:1', self.fragment)
+        self.cache.set('post-card:2', 'short')
+        stored = self.cache._cache.get_many(['post-card:1', 'post-card:2'])
+        self.assertLess(
+            len(stored['post-card:1']), len(self.fragment.encode()) / 10)
+        self.assertEqual(stored['post-card:2'], b'u-short')
+
+    def test_stats_per_key_prefix(self):
+        self.cache.set_many({'page:/': self.fragment, 'page:/group/': 'x'})
+        self.cache.get_many(['page:/', 'page:/group/'])
+        self.cache.set('feed-fragment:index', self.fragment)
+        report = self.cache.stats.report()
+        self.assertEqual(set(report), {'page', 'feed-fragment'})
+        self.assertEqual(report['page']['encoded'], 2)
+        self.assertEqual(report['page']['decoded'], 2)
+        self.assertGreater(report['feed-fragment']['ratio'], 10)
+
+    def test_misconfiguration(self):
+        options = (
+            {},
+            {'CACHE': LOCMEM, 'CODEC': 'brotli'},
+        )
+        for value in options:
+            with self.subTest(options=value):
+                with self.assertRaises(ImproperlyConfigured):
+                    CompressedCache('', {'OPTIONS': value})
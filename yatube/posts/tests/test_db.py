@@ -0,0 +1,20 @@
+from django.db import connection
+from django.test import TestCase
+from ..db import pragma_statements
+
+
+class SQLitePragmasTest(TestCase):
+    """Соединения с базой открываются с прагмами SQLITE_PRAGMAS."""
+
+    def test_connection_configured(self):
+        pragmas = {'busy_timeout': 5000, 'cache_size': -64000, 'temp_store': 2}
+        with connection.cursor() as cursor:
+            for name, expected in pragmas.items():
+                with self.subTest(pragma=name):
+                    cursor.execute(f'PRAGMA {name}')
+                    self.assertEqual(cursor.fetchone()[0], expected)
+
+    def test_pragma_statements(self):
+        self.assertEqual(
+            pragma_statements({'journal_mode': 'wal', 'busy_timeout': 10}),
+            ['PRAGMA journal_mode = wal', 'PRAGMA busy_timeout = 10'])
@@ -1,7 +1,9 @@
+from unittest import mock
+
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from ..models import Post, Follow
+from ..models import Post, Follow, TimelineEntry
 
 
 User = get_user_model()
@@ -58,3 +60,115 @@ class TestViewsPostsApp(TestCase):
         response = self.authorized_user_not_follower.get('/follow/')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.context['page_obj']), 0)
+
+
+class TimelineTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='Author')
+        self.reader = User.objects.create_user(username='Reader')
+        self.old_post = Post.objects.create(
+            text='Old post', author=self.author)
+        self.client_reader = Client()
+        self.client_reader.force_login(self.reader)
+        cache.clear()
+
+    def test_timeline_backfill_fan_out_and_prune(self):
+        """Лента заполняется при подписке и постинге, чистится отпиской."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=self.old_post).exists())
+
+        new_post = Post.objects.create(text='New post', author=self.author)
+        entry = TimelineEntry.objects.get(user=self.reader, post=new_post)
+        self.assertEqual(entry.pub_date, new_post.pub_date)
+
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.reader).exists())
+
+    def test_follow_page_reads_timeline(self):
+        """Страница подписок выводит посты ленты в порядке публикации."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(text=f'Post {i}', author=self.author)
+            for i in range(12)
+        ]
+        response = self.client_reader.get('/follow/')
+        page_obj = response.context['page_obj']
+        expected = list(
+            Post.objects.filter(author=self.author)
+            .order_by('-pub_date', '-pk')
+        )
+        self.assertEqual(list(page_obj), expected[:10])
+        self.assertEqual(page_obj[0], posts[-1])
+
+        response = self.client_reader.get(
+            '/follow/', {'after': page_obj.next_cursor})
+        self.assertEqual(list(response.context['page_obj']), expected[10:])
+
+
+class HybridFeedTest(TestCase):
+
+    def setUp(self):
+        threshold = mock.patch('posts.feeds.FEED_CELEBRITY_THRESHOLD', 2)
+        threshold.start()
+        self.addCleanup(threshold.stop)
+        self.author = User.objects.create_user(username='Author')
+        self.celebrity = User.objects.create_user(username='Celebrity')
+        self.reader = User.objects.create_user(username='Reader')
+        self.fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.celebrity)
+        # Пост до перехода порога уже разложен по лентам.
+        self.early_post = Post.objects.create(
+            text='Early post', author=self.celebrity)
+        Follow.objects.create(user=self.fan, author=self.celebrity)
+        for i in range(8):
+            Post.objects.create(text=f'Post {i}', author=self.author)
+            Post.objects.create(text=f'Star {i}', author=self.celebrity)
+        self.client_reader = Client()
+        self.client_reader.force_login(self.reader)
+        cache.clear()
+
+    def test_celebrity_posts_not_fanned_out(self):
+        """Посты знаменитости не раскладываются по лентам."""
+        self.assertEqual(
+            TimelineEntry.objects.filter(author=self.celebrity).count(), 1)
+
+    def test_hybrid_feed_matches_post_ordering(self):
+        """Гибридная лента совпадает с сортировкой постов без дублей."""
+        expected = list(
+            Post.objects.filter(author__following__user=self.reader)
+            .order_by('-pub_date', '-pk')
+        )
+        feed = []
+        params = {}
+        while True:
+            page_obj = self.client_reader.get(
+                '/follow/', params).context['page_obj']
+            feed.extend(page_obj)
+            if not page_obj.next_cursor:
+                break
+            params = {'after': page_obj.next_cursor}
+        self.assertEqual(feed, expected)
+
+        response = self.client_reader.get(
+            '/follow/', {'before': page_obj.previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), expected[:10])
+
+        response = self.client_reader.get('/follow/', {'page': 2})
+        self.assertEqual(list(response.context['page_obj']), expected[10:])
+
+    def test_former_celebrity_posts_return_to_feed(self):
+        """После перехода порога вниз посты автора остаются в ленте."""
+        Follow.objects.filter(user=self.fan, author=self.celebrity).delete()
+        self.assertEqual(
+            TimelineEntry.objects.filter(author=self.celebrity).count(), 9)
+        response = self.client_reader.get('/follow/')
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(
+                Post.objects.filter(author__following__user=self.reader)
+                .order_by('-pub_date', '-pk')[:10]
+            ))
@@ -1,11 +1,31 @@
-from django.test import Client, TestCase
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from PIL import Image
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
+from ..images import IMAGE_MAX_SIZE, ingest_image
 from ..models import Post, Group, Comment
+from sorl.thumbnail import default, get_thumbnail
+from ..thumbnails import (
+    THUMBNAIL_WIDTHS, generate_thumbnails, ready_srcset, ready_thumbnail)
 
 
 User = get_user_model()
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 class PostCreateFormTests(TestCase):
@@ -130,3 +150,133 @@ class PostCreateFormTests(TestCase):
                 author=self.user_author,
             ).exists()
         )
+
+
+class ThumbnailTests(TestCase):
+    """Миниатюры строятся при загрузке, а не при показе поста."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create_user(username='Uploader')
+
+    def setUp(self):
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user_author)
+        # Своя папка и чистый кэш: миниатюры прошлых тестов не мешают.
+        media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.addCleanup(media.disable)
+        cache.clear()
+
+    def uploaded(self):
+        return SimpleUploadedFile(
+            name='thumb.gif', content=SMALL_GIF, content_type='image/gif')
+
+    @mock.patch('posts.views.schedule_thumbnails')
+    def test_upload_schedules_thumbnails(self, schedule):
+        self.auth_client.post(
+            reverse('posts:create_post'),
+            data={'text': 'Пост с картинкой', 'image': self.uploaded()},
+        )
+        post = Post.objects.get(text='Пост с картинкой')
+        schedule.assert_called_once_with(post.image.name)
+
+        schedule.reset_mock()
+        self.auth_client.post(
+            reverse('posts:edit_post', kwargs={'pk': post.pk}),
+            data={'text': 'Только текст'},
+        )
+        schedule.assert_not_called()
+
+    def test_placeholder_until_thumbnail_ready(self):
+        post = Post.objects.create(
+            text='Картинка', author=self.user_author, image=self.uploaded())
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        self.assertIsNone(ready_thumbnail(post.image, '960x339'))
+        self.assertContains(self.auth_client.get(url), 'bg-light')
+
+        generate_thumbnails(post.image.name)
+        thumbnail = ready_thumbnail(
+            post.image, '960x339', crop='center', upscale=True)
+        self.assertIsNotNone(thumbnail)
+        response = self.auth_client.get(url)
+        self.assertContains(response, thumbnail.url)
+        self.assertNotContains(response, 'bg-light')
+
+    def test_srcset_ladder_from_single_decode(self):
+        """Все ширины строятся из одного декодирования исходника."""
+        post = Post.objects.create(
+            text='Лесенка', author=self.user_author, image=self.uploaded())
+        with mock.patch.object(
+                default.engine, 'get_image',
+                wraps=default.engine.get_image) as get_image:
+            generate_thumbnails(post.image.name)
+        self.assertEqual(get_image.call_count, 1)
+
+        thumbnails = ready_srcset(post)
+        self.assertEqual(
+            [thumbnail.width for thumbnail in thumbnails],
+            sorted(THUMBNAIL_WIDTHS))
+        # sorl находит те же миниатюры и не строит их заново.
+        with mock.patch.object(default.engine, 'get_image') as get_image:
+            same = get_thumbnail(
+                post.image, '960x339', crop='center', upscale=True)
+        get_image.assert_not_called()
+        self.assertEqual(same.name, thumbnails[-1].name)
+
+        response = self.auth_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        srcset = ', '.join(
+            f'{thumbnail.url} {thumbnail.width}w' for thumbnail in thumbnails)
+        self.assertContains(response, f'srcset="{srcset}"')
+
+
+class IngestImageTests(TestCase):
+    """Загруженные картинки сжимаются до компактного оригинала."""
+
+    @staticmethod
+    def camera_photo(size=(4000, 3000)):
+        image = Image.linear_gradient('L').resize(size).convert('RGB')
+        exif = Image.Exif()
+        # Ориентация 6: кадр снят с поворотом на 90°.
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=95, exif=exif.tobytes())
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_photo_is_downscaled_rotated_and_stripped(self):
+        stored, report = ingest_image(self.camera_photo())
+        image = Image.open(stored)
+        self.assertEqual(stored.name, 'photo.webp')
+        self.assertEqual(image.format, 'WEBP')
+        self.assertEqual(max(image.size), IMAGE_MAX_SIZE)
+        self.assertGreater(image.height, image.width)
+        self.assertEqual(dict(image.getexif()), {})
+        self.assertGreater(report.saved, 0)
+
+    def test_small_clean_image_kept_as_is(self):
+        upload = SimpleUploadedFile(
+            'tiny.gif', SMALL_GIF, content_type='image/gif')
+        stored, report = ingest_image(upload)
+        self.assertIs(stored, upload)
+        self.assertIsNone(report)
+
+    def test_form_stores_webp(self):
+        user = User.objects.create_user(username='Photographer')
+        client = Client()
+        client.force_login(user)
+        client.post(
+            reverse('posts:create_post'),
+            data={'text': 'Фото с камеры', 'image': self.camera_photo()},
+        )
+        post = Post.objects.get(author=user)
+        self.assertTrue(post.image.name.startswith('posts/'))
+        self.assertTrue(post.image.name.endswith('.webp'))
+        # Превью посчитано при загрузке.
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/webp;base64,'))
+        self.assertLess(len(post.image_placeholder), 500)
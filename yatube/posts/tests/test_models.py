@@ -1,6 +1,15 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
-from ..models import Group, Post
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from ..models import Group, Post, Comment, Follow, StoredImage, UserStats
+from ..storage import HashedMediaStorage, post_image_storage
 
 
 User = get_user_model()
@@ -61,3 +70,149 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     task._meta.get_field(field).help_text,
                     expected_value)
+
+
+class CountersTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(pk=user.pk)
+
+    def test_counters_follow_creation_and_deletion(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        comment = Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_each_comment_changes_post_updated(self):
+        """Карточка кэшируется по дате изменения, даже в пределах секунды."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        dates = []
+        for _ in range(2):
+            Comment.objects.create(
+                author=self.reader, post=post, text='Комментарий')
+            post.refresh_from_db()
+            dates.append(post.updated)
+        self.assertLess(dates[0], dates[1])
+
+    def test_counter_never_goes_negative(self):
+        """Уменьшение нулевого счётчика пропускается."""
+        UserStats.objects.bump(self.author.pk, 'posts_count', -1)
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_recount_counters_command(self):
+        """Команда recount_counters исправляет рассинхронизацию."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.filter(pk=self.author.pk).update(
+            posts_count=10, followers_count=0)
+        UserStats.objects.filter(pk=self.reader.pk).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class StoredImageTest(TestCase):
+    """Одинаковые картинки хранятся одним файлом со счётчиком ссылок."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        on_commit = mock.patch(
+            'posts.signals.transaction.on_commit', side_effect=lambda f: f())
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+
+    @staticmethod
+    def upload(name, content=b'GIF89a same bytes'):
+        return SimpleUploadedFile(name, content, content_type='image/gif')
+
+    def test_same_content_shares_file(self):
+        first = Post.objects.create(
+            author=self.user, text='1', image=self.upload('a.gif'))
+        second = Post.objects.create(
+            author=self.user, text='2', image=self.upload('b.GIF'))
+        other = Post.objects.create(
+            author=self.user, text='3',
+            image=self.upload('a.gif', b'GIF89a other'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertRegex(
+            first.image.name, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.gif$')
+        self.assertEqual(
+            StoredImage.objects.get(pk=first.image.name).references, 2)
+
+    def test_file_deleted_with_last_reference(self):
+        first = Post.objects.create(
+            author=self.user, text='1', image=self.upload('a.gif'))
+        second = Post.objects.create(
+            author=self.user, text='2', image=self.upload('b.gif'))
+        name = first.image.name
+
+        first.delete()
+        self.assertTrue(post_image_storage.exists(name))
+        second.image = self.upload('c.gif', b'GIF89a replaced')
+        second.save()
+        self.assertFalse(post_image_storage.exists(name))
+        self.assertFalse(StoredImage.objects.filter(pk=name).exists())
+        self.assertEqual(
+            StoredImage.objects.get(pk=second.image.name).references, 1)
+
+    def test_concurrent_upload_of_same_file(self):
+        """Файл записала другая загрузка между проверкой и записью."""
+        name = Post.objects.create(
+            author=self.user, text='1', image=self.upload('a.gif')).image.name
+        with mock.patch.object(
+                HashedMediaStorage, 'exists', side_effect=[False, True]):
+            saved = post_image_storage.save(
+                'posts/b.gif', ContentFile(b'GIF89a same bytes'))
+        self.assertEqual(saved, name)
+
+    def test_reused_file_not_deleted(self):
+        """Файл снова взяли до фиксации удаления последнего поста."""
+        first = Post.objects.create(
+            author=self.user, text='1', image=self.upload('a.gif'))
+        callbacks = []
+        with mock.patch(
+                'posts.signals.transaction.on_commit',
+                side_effect=callbacks.append):
+            first.delete()
+            Post.objects.create(
+                author=self.user, text='2', image=self.upload('b.gif'))
+        for callback in callbacks:
+            callback()
+        self.assertTrue(post_image_storage.exists(first.image.name))
@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Comment, Follow, Group, Post
+from ..views import POSTS_OUTPUT_COUNT
+
+
+User = get_user_model()
+
+
+def query_plan(sql: str, params=None) -> list:
+    """Строки EXPLAIN QUERY PLAN для запроса."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan(step: str) -> bool:
+    """Полный проход таблицы или сортировка во временном B-дереве.
+
+    Проход по индексу (SCAN ... USING INDEX) нужен лентам без фильтра:
+    страница берётся из его начала.
+    """
+    return (
+        'TEMP B-TREE' in step
+        or step.startswith('SCAN') and 'USING' not in step
+    )
+
+
+class FeedQueryPlanTest(TestCase):
+    """Запросы лент идут по индексам и не сортируют выборку."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='Test-group-slug',
+            description='Test group description'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(POSTS_OUTPUT_COUNT * 2):
+            cls.post = Post.objects.create(
+                text=f'Test post {i}', author=cls.author, group=cls.group)
+        Comment.objects.create(
+            text='Comment', author=cls.reader, post=cls.post)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def assertIndexedQueries(self, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data)
+        for query in context.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            plan = query_plan(query['sql'])
+            with self.subTest(url=url, data=data, sql=query['sql']):
+                self.assertFalse(
+                    [step for step in plan if is_full_scan(step)], plan)
+        return response
+
+    def test_feed_pages_use_indexes(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            response = self.assertIndexedQueries(url)
+            cursor = response.context['page_obj'].next_cursor
+            self.assertIndexedQueries(url, {'after': cursor})
+            self.assertIndexedQueries(url, {'page': 2})
+
+    def test_post_comments_use_index(self):
+        self.assertIndexedQueries(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+
+    def test_follow_lookups_use_indexes(self):
+        queries = (
+            Follow.objects.filter(author=self.author).values('user'),
+            Follow.objects.filter(
+                user=self.reader, author__username=self.author.username),
+        )
+        for queryset in queries:
+            plan = query_plan(*queryset.query.sql_with_params())
+            with self.subTest(query=str(queryset.query)):
+                self.assertTrue(all('INDEX' in step for step in plan), plan)
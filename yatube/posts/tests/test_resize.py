@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, Client, override_settings
+from PIL import Image
+from ..models import Post
+from ..resize import DiskLRUCache, _resize, get_variant, resize_url
+
+
+User = get_user_model()
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ResizeImageTest(TestCase):
+    """Картинки произвольного размера по подписанной ссылке."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'PNG')
+        cls.content = buffer.getvalue()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.post = Post.objects.create(
+            author=User.objects.create_user(username='auth'),
+            text='С картинкой',
+            image=SimpleUploadedFile(
+                'red.png', self.content, content_type='image/png'),
+        )
+
+    def test_resize_and_cache(self):
+        url = resize_url(self.post.pk, 100, 100, crop=True, fmt='jpeg')
+        with mock.patch('posts.resize._resize', wraps=_resize) as resize:
+            first = self.client.get(url)
+            second = self.client.get(url)
+        self.assertEqual(resize.call_count, 1)
+        self.assertEqual(first['Content-Type'], 'image/jpeg')
+        self.assertEqual(first['ETag'], second['ETag'])
+        image = Image.open(BytesIO(b''.join(first.streaming_content)))
+        self.assertEqual((image.format, image.size), ('JPEG', (100, 100)))
+
+        response = self.client.get(resize_url(self.post.pk, 100))
+        image = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual((image.format, image.size), ('WEBP', (100, 50)))
+
+    def test_invalid_links(self):
+        url = resize_url(self.post.pk, 100)
+        self.assertEqual(self.client.get(url[:-2] + 'x/').status_code, 404)
+        too_big = resize_url(self.post.pk, 100000)
+        self.assertEqual(self.client.get(too_big).status_code, 404)
+        missing = resize_url(self.post.pk + 1, 100)
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+    def test_variant_evicted_before_open(self):
+        """Вариант, вытесненный сразу после нарезки, нарезается снова."""
+        calls = []
+
+        def evicted_once(*args):
+            key, path = get_variant(*args)
+            calls.append(path)
+            if len(calls) == 1:
+                os.remove(path)
+            return key, path
+
+        with mock.patch(
+                'posts.views.get_variant', side_effect=evicted_once):
+            response = self.client.get(resize_url(self.post.pk, 100))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+        response.close()
+
+    def test_concurrent_requests_resize_once(self):
+        """Одновременные запросы варианта ждут одну нарезку."""
+        def slow_resize(*args):
+            time.sleep(0.05)
+            return _resize(*args)
+
+        with mock.patch(
+                'posts.resize._resize', side_effect=slow_resize) as resize:
+            threads = [
+                threading.Thread(
+                    target=get_variant,
+                    args=(self.post.image, 50, 0, False, 'png'))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(resize.call_count, 1)
+
+    @override_settings(RESIZE_CACHE_DIR=os.path.join(MEDIA_ROOT, 'lru'))
+    def test_least_recently_used_evicted(self):
+        lru = DiskLRUCache(max_bytes=250)
+        paths = [lru.path(f'{number:02d}key', 'bin') for number in range(3)]
+        for age, path in enumerate(paths[:2]):
+            lru.store(path, b'x' * 100)
+            os.utime(path, (age, age))
+        # Первый файл запрошен последним и остаётся в кэше.
+        lru.touch(paths[0])
+        lru.store(paths[2], b'x' * 100)
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+
+    @override_settings(RESIZE_CACHE_DIR=os.path.join(MEDIA_ROOT, 'shared'))
+    def test_size_shared_between_processes(self):
+        """Объём считается по записям всех процессов, а не одного."""
+        processes = [DiskLRUCache(max_bytes=250) for _ in range(2)]
+        paths = [
+            processes[0].path(f'{number:02d}key', 'bin')
+            for number in range(3)
+        ]
+        for age, (lru, path) in enumerate(zip(processes * 2, paths)):
+            lru.store(path, b'x' * 100)
+            os.utime(path, (age, age))
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[2]))
@@ -0,0 +1,104 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+from .. import routers
+from ..models import Post
+from ..routers import (
+    ReplicaRouter, ReplicaStickinessMiddleware, reads_from_primary,
+    use_primary)
+from .utils import add_test_database
+
+
+SECOND_DATABASE = add_test_database('shard_1')
+
+
+User = get_user_model()
+
+
+@mock.patch.object(routers, 'REPLICA_DATABASES', ('replica',))
+class ReplicaRouterTest(TestCase):
+    """Посты читаются с реплик, записи и прочие модели — из default."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.addCleanup(use_primary, False)
+
+    def test_posts_read_from_replica(self):
+        self.assertEqual(self.router.db_for_read(Post), 'replica')
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_primary_reads_when_pinned(self):
+        use_primary()
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_replicas_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+
+    def test_no_replicas(self):
+        with mock.patch.object(routers, 'REPLICA_DATABASES', ()):
+            self.assertIsNone(self.router.db_for_read(Post))
+            self.assertIsNone(self.router.db_for_write(Post))
+
+    def test_other_apps_written_anywhere(self):
+        self.assertIsNone(self.router.db_for_write(User))
+
+
+class SecondDatabaseMigrateTest(TestCase):
+    """Роутеры из настроек не мешают развернуть схему в другой базе."""
+
+    databases = {'default', SECOND_DATABASE}
+
+    def test_migrate_second_database(self):
+        call_command('migrate', database=SECOND_DATABASE, verbosity=0)
+        self.assertTrue(Permission.objects.using(SECOND_DATABASE).exists())
+
+
+# Роль реплики играет та же база, чтобы запросы представлений работали.
+@mock.patch.object(routers, 'REPLICA_DATABASES', ('default',))
+class ReplicaStickinessTest(TestCase):
+    """Автор изменения какое-то время читает из основной базы."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.post = Post.objects.create(text='Test post', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.middleware = ReplicaStickinessMiddleware(
+            lambda request: reads_from_primary())
+
+    def reads_primary(self, user) -> bool:
+        request = RequestFactory().get('/')
+        request.user = user
+        return self.middleware(request)
+
+    def test_writes_stick_author_to_primary(self):
+        actions = {
+            'comment': lambda: self.client.post(
+                reverse('posts:add_comment', kwargs={'pk': self.post.pk}),
+                {'text': 'Comment'}),
+            'post': lambda: self.client.post(
+                reverse('posts:create_post'), {'text': 'New post'}),
+            'follow': lambda: self.client.get(reverse(
+                'posts:profile_follow', kwargs={'username': self.author})),
+        }
+        for name, action in actions.items():
+            with self.subTest(action=name):
+                cache.clear()
+                self.assertFalse(self.reads_primary(self.reader))
+                action()
+                self.assertTrue(self.reads_primary(self.reader))
+                self.assertFalse(self.reads_primary(self.author))
+        self.assertFalse(reads_from_primary())
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, Client
+from django.urls import reverse
+from ..models import Post
+from ..search import (
+    SearchPaginator, highlight, index_posts, match_expression, stem)
+
+
+User = get_user_model()
+
+
+class StemTest(TestCase):
+
+    def test_word_forms_share_stem(self):
+        """Формы одного слова приводятся к общей основе."""
+        self.assertEqual(stem('коты'), stem('котами'))
+        self.assertEqual(stem('Ёлки'), stem('елка'))
+        self.assertEqual(stem('красивейшая'), stem('красивый'))
+
+    def test_match_expression_skips_stop_words(self):
+        self.assertEqual(
+            match_expression('Котами и собаки'), '"кот"* "собак"*')
+        self.assertEqual(match_expression('и в на'), '')
+
+    def test_highlight_escapes_and_marks(self):
+        snippet = highlight('<b>Кот</b> спит с котами', 'коты')
+        self.assertEqual(
+            snippet,
+            '&lt;b&gt;<mark>Кот</mark>&lt;/b&gt; спит с <mark>котами</mark>')
+
+
+class SearchViewTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='auth')
+        cls.best = Post.objects.create(
+            author=cls.author, text='Коты, коты и снова коты')
+        cls.other = Post.objects.create(
+            author=cls.author,
+            text='Длинная запись про погоду, где один раз упомянуты котами '
+                 'и ещё много других слов про дождь и ветер')
+        Post.objects.create(author=cls.author, text='Про собак')
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_search_finds_word_forms_ranked(self):
+        """Поиск находит формы слова, релевантные записи первыми."""
+        response = self.client.get(reverse('posts:search'), {'q': 'кот'})
+        posts = list(response.context['page_obj'])
+        self.assertEqual(posts, [self.best, self.other])
+        self.assertContains(response, '<mark>котами</mark>')
+
+    def test_index_follows_edit_and_delete(self):
+        best = Post.objects.get(pk=self.best.pk)
+        best.text = 'Теперь про собак'
+        best.save()
+        Post.objects.get(pk=self.other.pk).delete()
+        response = self.client.get(reverse('posts:search'), {'q': 'кот'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.client.get(reverse('posts:search'), {'q': 'собака'})
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    def test_search_cursor_pages(self):
+        """Страницы выдачи идут по курсору без повторов."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Кот номер {number}')
+            for number in range(12)
+        )
+        # bulk_create не шлёт сигналов: индексируем явно.
+        index_posts(Post.objects.values_list('pk', 'text'))
+        first = SearchPaginator('кот', 10).get_page(1)
+        self.assertIsNotNone(first.next_cursor)
+        second = SearchPaginator('кот', 10).get_cursor_page(
+            after=first.next_cursor)
+        self.assertEqual(len(first) + len(second), 14)
+        self.assertFalse(set(first) & set(second))
+        self.assertIsNone(second.next_cursor)
+        response = self.client.get(reverse('posts:search'), {'q': 'кот'})
+        self.assertContains(
+            response, f'?q=%D0%BA%D0%BE%D1%82&amp;after={first.next_cursor}')
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'котов'})
+        self.assertEqual(response.context['cl'].result_count, 2)
@@ -0,0 +1,236 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+from .. import sharding
+from ..db import configure_connection
+from ..models import (
+    Comment, Follow, Group, Post, PostLocation, TimelineEntry)
+from ..routers import ShardRouter
+from ..sharding import group_by_shard, shard_for_author
+from ..views import POSTS_OUTPUT_COUNT
+from .utils import add_test_database
+
+
+User = get_user_model()
+SECOND_SHARD = add_test_database('shard_1')
+
+
+@mock.patch.object(sharding, 'POST_SHARDS', ('shard_0', 'shard_1'))
+class ShardRouterTest(TestCase):
+    """Посты и комментарии идут в шард автора, остальное — в default."""
+
+    def setUp(self):
+        self.router = ShardRouter()
+        self.author = User(pk=3, username='Author')
+
+    def test_shard_for_author(self):
+        self.assertEqual(shard_for_author(2), 'shard_0')
+        self.assertEqual(shard_for_author(3), 'shard_1')
+        self.assertEqual(
+            group_by_shard([1, 2, 3]),
+            {'shard_1': [1, 3], 'shard_0': [2]})
+
+    def test_posts_and_comments_follow_author(self):
+        post = Post(pk=10, author=self.author, text='Test post')
+        comment = Comment(post=post, author=User(pk=2), text='Comment')
+        self.assertEqual(
+            self.router.db_for_write(Post, instance=post), 'shard_1')
+        self.assertEqual(
+            self.router.db_for_write(Comment, instance=comment), 'shard_1')
+        self.assertEqual(
+            self.router.db_for_read(Post, instance=self.author), 'shard_1')
+
+    def test_related_objects_read_from_default(self):
+        post = Post(pk=10, author=self.author, text='Test post')
+        self.assertEqual(
+            self.router.db_for_read(User, instance=post), 'default')
+        self.assertEqual(
+            self.router.db_for_read(Group, instance=post), 'default')
+        self.assertIsNone(self.router.db_for_read(Post))
+        self.assertTrue(self.router.allow_relation(post, self.author))
+
+    def test_no_shards(self):
+        post = Post(pk=10, author=self.author, text='Test post')
+        with mock.patch.object(sharding, 'POST_SHARDS', ()):
+            self.assertIsNone(self.router.db_for_write(Post, instance=post))
+            self.assertIsNone(shard_for_author(self.author.pk))
+
+
+class ShardedPagesTest(TestCase):
+    """Страницы работают, когда посты лежат в шардах.
+
+    Роль единственного шарда играет default, чтобы запросы
+    представлений выполнялись в тестовой базе.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(sharding, 'POST_SHARDS', ('default',))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+        self.author = User.objects.create_user(username='Author')
+        self.reader = User.objects.create_user(username='Reader')
+        self.group = Group.objects.create(
+            title='Test group',
+            slug='Test-group-slug',
+            description='Test group description'
+        )
+        self.client = Client()
+        self.client.force_login(self.author)
+        self.client.post(
+            reverse('posts:create_post'),
+            {'text': 'Sharded post', 'group': self.group.pk})
+        self.post = Post.objects.get(text='Sharded post')
+
+    def test_post_id_comes_from_location(self):
+        location = PostLocation.objects.get(pk=self.post.pk)
+        self.assertEqual(location.author_id, self.author.pk)
+        self.post.delete()
+        self.assertFalse(PostLocation.objects.filter(pk=self.post.pk))
+
+    def test_feeds_show_post(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.author}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    list(response.context['page_obj']), [self.post])
+
+    def test_follow_feed_shows_post(self):
+        reader = Client()
+        reader.force_login(self.reader)
+        reader.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}))
+        response = reader.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_comment_on_sharded_post(self):
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'pk': self.post.pk}),
+            {'text': 'Comment'})
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Comment'])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+
+class MultipleShardsTest(TransactionTestCase):
+    """Посты двух авторов лежат в разных базах SQLite.
+
+    TransactionTestCase нужен, чтобы прагмы соединений применились
+    вне транзакции, а внешние ключи проверялись при фиксации.
+    """
+
+    databases = {'default', SECOND_SHARD}
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            sharding, 'POST_SHARDS', ('default', SECOND_SHARD))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for alias in self.databases:
+            configure_connection(connections[alias])
+            self.addCleanup(
+                connections[alias].cursor().execute,
+                'PRAGMA foreign_keys = ON')
+        cache.clear()
+        users = [
+            User.objects.create_user(username=f'User{number}')
+            for number in range(2)
+        ]
+        self.authors = {shard_for_author(user.pk): user for user in users}
+        self.reader = User.objects.create_user(username='Reader')
+        self.posts = [
+            Post.objects.create(
+                text=f'Post {number}', author=self.authors[alias])
+            for number in range(POSTS_OUTPUT_COUNT // 2 + 1)
+            for alias in self.authors
+        ]
+        self.posts.sort(key=lambda post: (post.pub_date, post.pk))
+        self.posts.reverse()
+
+    def test_user_delete_removes_sharded_posts(self):
+        author = self.authors[SECOND_SHARD]
+        author.delete()
+        self.assertFalse(
+            Post.objects.using(SECOND_SHARD).filter(author_id=author.pk))
+        self.assertFalse(PostLocation.objects.filter(author_id=author.pk))
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            len(response.context['page_obj']), POSTS_OUTPUT_COUNT // 2 + 1)
+
+    def test_post_delete_removes_timeline_entries(self):
+        author = self.authors[SECOND_SHARD]
+        Follow.objects.create(user=self.reader, author=author)
+        post = Post.objects.using(SECOND_SHARD).filter(author=author).first()
+        post.delete()
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post.pk))
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(),
+            POSTS_OUTPUT_COUNT // 2)
+
+    def test_group_delete_removes_sharded_posts(self):
+        group = Group.objects.create(
+            title='Test group', slug='Test-group-slug', description='')
+        Post.objects.using(SECOND_SHARD).update(group=group)
+        group.delete()
+        self.assertFalse(Post.objects.using(SECOND_SHARD).exists())
+
+    def test_foreign_keys_off(self):
+        """Автор поста из шарда лежит в default, а не в базе шарда."""
+        for alias in self.databases:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('PRAGMA foreign_keys')
+                self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertTrue(Post.objects.using(SECOND_SHARD).exists())
+        self.assertFalse(User.objects.using(SECOND_SHARD).exists())
+
+    def test_index_merges_shards(self):
+        url = reverse('posts:index')
+        first = self.client.get(url).context['page_obj']
+        self.assertEqual(list(first), self.posts[:POSTS_OUTPUT_COUNT])
+        pages = (
+            self.client.get(url, {'after': first.next_cursor}),
+            self.client.get(url, {'page': 2}),
+        )
+        for response in pages:
+            self.assertEqual(
+                list(response.context['page_obj']),
+                self.posts[POSTS_OUTPUT_COUNT:])
+
+    def test_follow_feed_reads_posts_from_shards(self):
+        for author in self.authors.values():
+            Follow.objects.create(user=self.reader, author=author)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            self.posts[:POSTS_OUTPUT_COUNT])
+
+    def test_comment_on_second_shard(self):
+        post = Post.objects.using(SECOND_SHARD).first()
+        self.client.force_login(self.reader)
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'pk': post.pk}),
+            {'text': 'Comment'})
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertEqual(response.context['post'], post)
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Comment'])
+        self.assertEqual(
+            Comment.objects.using(SECOND_SHARD).get().post_id, post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
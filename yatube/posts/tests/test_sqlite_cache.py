@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.test import TestCase
+from ..sqlite_cache import SQLiteCache
+
+
+class SQLiteCacheTest(TestCase):
+    """Кэш в файле SQLite общий для всех экземпляров бэкенда."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': options})
+
+    def test_values_shared_between_instances(self):
+        """Второй экземпляр, как другой воркер, видит записи и сбросы."""
+        other = self.make_cache()
+        self.cache.set('version', 1)
+        self.assertEqual(other.get('version'), 1)
+        other.incr('version')
+        self.assertEqual(self.cache.get('version'), 2)
+        other.delete('version')
+        self.assertIsNone(self.cache.get('version'))
+
+    def test_add_only_missing_or_expired(self):
+        self.assertTrue(self.cache.add('lock', 1))
+        self.assertFalse(self.cache.add('lock', 2))
+        self.cache.set('expired', 1, timeout=0)
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertEqual(self.cache.get('expired'), 2)
+
+    def test_expired_value_not_returned(self):
+        self.cache.set('fragment', '<p>', timeout=1)
+        with mock.patch('time.time', return_value=time.time() + 2):
+            self.assertIsNone(self.cache.get('fragment'))
+            self.assertFalse(self.cache.has_key('fragment'))
+
+    def test_get_many_and_set_many(self):
+        self.cache.set_many({'a': 1, 'b': [2]})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': [2]})
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    def test_incr_missing_key(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_least_recently_read_evicted_over_size_cap(self):
+        cache = self.make_cache(MAX_BYTES=3000, CULL_FREQUENCY=4)
+        now = time.time()
+        for number in range(3):
+            with mock.patch('time.time', return_value=now + number * 10):
+                cache.set(f'page-{number}', 'x' * 900)
+        with mock.patch('time.time', return_value=now + 30):
+            cache.get('page-0')
+        with mock.patch('time.time', return_value=now + 40):
+            cache.set('page-3', 'x' * 900)
+        self.assertEqual(
+            set(cache.get_many([f'page-{n}' for n in range(4)])),
+            {'page-0', 'page-3'})
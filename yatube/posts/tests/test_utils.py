@@ -0,0 +1,58 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from ..models import Post
+from ..utils import CursorPaginator
+
+
+User = get_user_model()
+
+
+class CursorPaginatorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        Post.objects.bulk_create(
+            Post(text=f'Test post {i}', author=cls.user)
+            for i in range(1, 101)
+        )
+
+    def test_elided_page_range(self):
+        """Диапазон страниц ограничен окном вокруг текущей."""
+        paginator = CursorPaginator(Post.objects.all(), 2)
+        ellipsis = CursorPaginator.ELLIPSIS
+        page_ranges = {
+            1: [1, 2, 3, ellipsis, 50],
+            25: [1, ellipsis, 23, 24, 25, 26, 27, ellipsis, 50],
+            50: [1, ellipsis, 48, 49, 50],
+        }
+        for number, expected in page_ranges.items():
+            with self.subTest(number=number):
+                self.assertEqual(
+                    paginator.get_elided_page_range(number), expected)
+
+    def test_short_page_range_not_elided(self):
+        """Короткий диапазон страниц выводится целиком."""
+        paginator = CursorPaginator(Post.objects.all(), 20)
+        self.assertEqual(
+            paginator.get_elided_page_range(3), [1, 2, 3, 4, 5])
+
+    def test_uncounted_page_skips_count(self):
+        """Без подсчёта страница выбирается одним запросом."""
+        paginator = CursorPaginator(
+            Post.objects.all(), 10, with_count=False)
+        with self.assertNumQueries(1):
+            page = paginator.get_page(3)
+        self.assertEqual(len(page), 10)
+        self.assertEqual(page.page_links, [])
+        self.assertIsNotNone(page.previous_cursor)
+        self.assertIsNotNone(page.next_cursor)
+
+    def test_uncounted_page_out_of_range(self):
+        """Страница за концом ленты заменяется первой."""
+        paginator = CursorPaginator(
+            Post.objects.all(), 10, with_count=False)
+        page = paginator.get_page(100)
+        self.assertEqual(page.number, 1)
+        self.assertIsNone(page.previous_cursor)
@@ -1,10 +1,16 @@
+from unittest import mock
+
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
-from ..models import Post, Group
+from .. import cache as feed_cache
+from ..models import Post, Group, Comment, Follow
 from ..forms import PostForm
+from ..templatetags.post_cards import post_cards
+from ..views import POSTS_OUTPUT_COUNT
+from .utils import QueryBudgetMixin
 
 
 User = get_user_model()
@@ -211,6 +217,31 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(pages_response=pages_response):
                 self.assertEqual(response_len, expected_len)
 
+    def test_paginator_cursor_pages(self):
+        """Курсоры ?after= и ?before= листают ленту без пропусков."""
+        first_page = self.authorized_client_author.get(
+            reverse('posts:index')).context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        second_page = self.authorized_client_author.get(
+            reverse('posts:index'),
+            {'after': first_page.next_cursor}).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertIsNone(second_page.next_cursor)
+        self.assertEqual(
+            list(second_page),
+            list(Post.objects.order_by('-pub_date', '-pk')[10:]))
+        back_page = self.authorized_client_author.get(
+            reverse('posts:index'),
+            {'before': second_page.previous_cursor}).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_paginator_broken_cursor(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.authorized_client_author.get(
+            reverse('posts:index'), {'after': '!!broken!!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 10)
+
     def test_posts_create_in_index_profile_page(self):
         """Пост поподает на гланую и профайл страницы."""
         self.post_test = Post.objects.create(
@@ -270,3 +301,371 @@ class CaheTest(TestCase):
         cache.clear()
         second_cache = self.user.get(reverse('posts:index')).content
         self.assertTrue(first_cache, second_cache)
+
+
+class FeedQueriesTest(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user_author = User.objects.create_user(username='TestUser')
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='Test-group-slug',
+            description='Test group description'
+        )
+        Follow.objects.create(user=cls.follower, author=cls.user_author)
+        for i in range(POSTS_OUTPUT_COUNT + 3):
+            post = Post.objects.create(
+                text=f'Test post {i}',
+                author=cls.user_author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                text='Test comment', author=cls.follower, post=post)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.follower)
+        cache.clear()
+
+    def test_feed_pages_fit_query_budget(self):
+        """Лента не делает запросов на каждый пост."""
+        # Сессия и пользователь, страница ленты, COUNT для номеров
+        # страниц и данные шапки профиля, но не запросы на каждый пост.
+        feed_budgets = {
+            reverse('posts:index'): 3,
+            reverse('posts:group_list', kwargs={
+                'slug': self.group.slug}): 5,
+            reverse('posts:profile', kwargs={
+                'username': self.user_author.username}): 6,
+            reverse('posts:follow_index'): 5,
+        }
+        for url, budget in feed_budgets.items():
+            with self.subTest(url=url):
+                with self.assertQueryBudget(budget):
+                    response = self.authorized_client.get(url)
+                self.assertEqual(
+                    response.context['page_obj'][0].comments_count, 1)
+
+    def test_thumbnails_fetched_in_one_query(self):
+        """Миниатюры всех постов страницы достаются одним запросом."""
+        for post in Post.objects.all():
+            Post.objects.filter(pk=post.pk).update(
+                image=f'posts/image-{post.pk}.gif')
+        with self.assertQueryBudget(4):
+            response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'bg-light', POSTS_OUTPUT_COUNT)
+
+
+class FeedCacheInvalidationTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='Test-group-slug',
+            description='Test group description'
+        )
+        for i in range(POSTS_OUTPUT_COUNT + 1):
+            Post.objects.create(
+                text=f'Test post {i}', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+
+    def test_feed_pages_cached_separately(self):
+        """Вторая страница не берёт посты из кэша первой."""
+        first_page = self.client.get(reverse('posts:index')).content
+        second_page = self.client.get(
+            reverse('posts:index'), {'page': 2}).content
+        self.assertNotEqual(first_page, second_page)
+        self.assertIn('Test post 0', second_page.decode())
+
+    def test_feeds_show_new_post_immediately(self):
+        """Новый пост сразу виден в закэшированных лентах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            self.client.get(url)
+        Post.objects.create(
+            text='Fresh post', author=self.user, group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Fresh post', response.content.decode())
+
+    def test_group_rename_refreshes_feeds(self):
+        """Новое название группы сразу видно в закэшированных лентах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={
+                'post_id': Post.objects.latest('pk').pk}),
+        )
+        for url in urls:
+            self.client.get(url)
+        self.group.title = 'Renamed group'
+        self.group.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Renamed group')
+
+    def test_comment_refreshes_cached_card(self):
+        """Новый комментарий обновляет счётчик в закэшированной ленте."""
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertNotIn('коментарии: 1', response.content.decode())
+        Comment.objects.create(
+            text='Comment', author=self.user, post=Post.objects.latest('pk'))
+        response = self.client.get(url)
+        self.assertIn('коментарии: 1', response.content.decode())
+
+
+class PostCardCacheTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(text='Cached card', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cards_fetched_with_single_get_many(self):
+        """Карточки страницы достаются из кэша одним обращением."""
+        post_cards([self.post])
+        with mock.patch.object(
+                cache, 'get_many', wraps=cache.get_many) as get_many:
+            with mock.patch(
+                    'posts.templatetags.post_cards.render_to_string'
+            ) as render:
+                cards = post_cards([self.post])
+        get_many.assert_called_once()
+        render.assert_not_called()
+        self.assertIn('Cached card', cards[0])
+
+    def test_only_first_cards_load_eagerly(self):
+        """Картинки ниже первого экрана грузятся лениво, с заглушкой."""
+        posts = [
+            Post.objects.create(
+                text=f'Image post {i}', author=self.user,
+                image='posts/missing.webp',
+                image_placeholder='data:image/webp;base64,AAAA')
+            for i in range(4)
+        ]
+        for post in posts:
+            post._prefetched_srcset = [mock.Mock(
+                url=f'/media/{post.pk}.webp', width=960, height=339)]
+        with mock.patch('posts.templatetags.post_cards.prefetch_srcsets'):
+            cards = post_cards(posts)
+        self.assertIn('loading="eager"', cards[1])
+        self.assertIn('loading="lazy"', cards[2])
+        self.assertIn('url(data:image/webp;base64,AAAA)', cards[3])
+        self.assertIn('width="960" height="339"', cards[3])
+
+    def test_card_rerendered_after_post_change(self):
+        """Изменение поста меняет ключ его карточки."""
+        post_cards([self.post])
+        Post.objects.filter(pk=self.post.pk).update(text='Stale text')
+        stale_post = Post.objects.get(pk=self.post.pk)
+        self.assertIn('Cached card', post_cards([stale_post])[0])
+        stale_post.save()
+        self.assertIn('Stale text', post_cards([stale_post])[0])
+
+    def test_card_rerendered_after_group_and_author_change(self):
+        """Новые название группы и имя автора сразу видны в карточке."""
+        group = Group.objects.create(title='Old title', slug='old-title')
+        Post.objects.filter(pk=self.post.pk).update(group=group)
+        post_cards([Post.objects.get(pk=self.post.pk)])
+        group.title = 'New title'
+        group.save()
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        card = post_cards([Post.objects.for_feed().get(pk=self.post.pk)])[0]
+        self.assertIn('New title', card)
+        self.assertIn('Renamed', card)
+
+
+class ConditionalGetTest(QueryBudgetMixin, TestCase):
+    """Неизменившиеся страницы отдаются ответом 304 без отрисовки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='Test-group-slug',
+            description='Test group description'
+        )
+        cls.post = Post.objects.create(
+            text='Test post', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+        self.urls = {
+            'group': reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}),
+            'profile': reverse(
+                'posts:profile', kwargs={'username': self.author}),
+            'post': reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}),
+        }
+
+    def test_unchanged_pages_not_modified(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                etag = self.client.get(url)['ETag']
+                with self.assertQueryBudget(1):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.content)
+
+    def test_relogin_produces_new_validators(self):
+        """После повторного входа форма комментария получает новый токен."""
+        url = self.urls['post']
+        self.client.force_login(self.reader)
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        self.client.logout()
+        self.client.force_login(self.reader)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_has_last_modified(self):
+        response = self.client.get(self.urls['post'])
+        response = self.client.get(
+            self.urls['post'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_new_validators(self):
+        changes = {
+            'group': lambda: Post.objects.create(
+                text='New post', author=self.author, group=self.group),
+            'profile': lambda: Follow.objects.create(
+                user=self.reader, author=self.author),
+            'post': lambda: Comment.objects.create(
+                text='Comment', author=self.reader, post=self.post),
+        }
+        for name, change in changes.items():
+            with self.subTest(page=name):
+                etag = self.client.get(self.urls[name])['ETag']
+                change()
+                response = self.client.get(
+                    self.urls[name], HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_group_rename_produces_new_validators(self):
+        """Название группы выводится на всех трёх страницах."""
+        etags = {
+            name: self.client.get(url)['ETag']
+            for name, url in self.urls.items()
+        }
+        self.group.save()
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 200)
+
+    def test_validators_differ_per_user(self):
+        etag = self.client.get(self.urls['profile'])['ETag']
+        self.client.force_login(self.reader)
+        response = self.client.get(
+            self.urls['profile'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class AnonymousPageCacheTest(QueryBudgetMixin, TestCase):
+    """Анонимным читателям страницы отдаются из кэша целиком."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='Test-group-slug',
+            description='Test group description'
+        )
+        cls.post = Post.objects.create(
+            text='Test post', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+        self.urls = {
+            'index': reverse('posts:index'),
+            'group': reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}),
+            'profile': reverse(
+                'posts:profile', kwargs={'username': self.author}),
+            'post': reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}),
+        }
+
+    def test_repeated_request_served_from_cache(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                first = self.client.get(url)
+                self.assertEqual(first['X-Page-Cache'], 'MISS')
+                with self.assertQueryBudget(1):
+                    second = self.client.get(url)
+                self.assertEqual(second['X-Page-Cache'], 'HIT')
+                self.assertEqual(second.content, first.content)
+
+    def test_writes_purge_affected_pages(self):
+        changes = {
+            'index': lambda: Post.objects.create(
+                text='New post', author=self.author),
+            'group': lambda: Post.objects.create(
+                text='Group post', author=self.author, group=self.group),
+            'profile': lambda: Follow.objects.create(
+                user=self.reader, author=self.author),
+            'post': lambda: Comment.objects.create(
+                text='Fresh comment', author=self.reader, post=self.post),
+        }
+        for name, change in changes.items():
+            with self.subTest(page=name):
+                self.client.get(self.urls[name])
+                change()
+                response = self.client.get(self.urls[name])
+                self.assertEqual(response['X-Page-Cache'], 'MISS')
+
+    @mock.patch.object(feed_cache, 'FEED_REFRESH_WORKERS', 2)
+    def test_page_after_write_not_stored_stale(self):
+        """С фоновым обновлением фрагментов кэш страницы тоже свежий."""
+        self.client.get(self.urls['index'])
+        Post.objects.create(text='Fresh post', author=self.author)
+        first = self.client.get(self.urls['index'])
+        second = self.client.get(
+            self.urls['index'], HTTP_IF_NONE_MATCH=first['ETag'])
+        third = self.client.get(self.urls['index'])
+        self.assertEqual(first['X-Page-Cache'], 'MISS')
+        self.assertContains(first, 'Fresh post')
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(third['X-Page-Cache'], 'HIT')
+        self.assertContains(third, 'Fresh post')
+
+    def test_authorized_user_bypasses_cache(self):
+        self.client.force_login(self.reader)
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                self.client.get(url)
+                response = self.client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'BYPASS')
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Примесь для TestCase с проверкой бюджета SQL-запросов."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget: int):
+        """Падает, если блок выполнил больше budget запросов."""
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(context.captured_queries, 1)
+            )
+            self.fail(
+                f'Выполнено {executed} запросов при бюджете {budget}:\n'
+                f'{queries}'
+            )
+
+
+def add_test_database(alias: str) -> str:
+    """Регистрирует ещё одну базу SQLite для тестов с несколькими базами.
+
+    Вызывается при импорте модуля тестов: тестовые базы создаются
+    после сбора тестов, и для alias тоже будет выполнен migrate.
+    """
+    connections.databases.setdefault(alias, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'{alias}.sqlite3',
+    })
+    return alias
@@ -0,0 +1,207 @@
+"""Фоновая нарезка миниатюр иллюстраций постов.
+
+Миниатюры всех ширин лесенки строятся сразу после загрузки картинки
+в пуле потоков, исходник декодируется один раз. Пока миниатюр нет,
+шаблоны выводят заглушку и не нарезают картинку в потоке запроса.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, delete
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from .cache import bump_post_feeds
+from .models import Post
+from .sharding import shards
+from .storage import post_image_storage
+
+
+logger = logging.getLogger(__name__)
+
+# Ширины миниатюр для srcset и пропорции кадра в ленте.
+THUMBNAIL_WIDTHS = tuple(
+    getattr(settings, 'THUMBNAIL_WIDTHS', (480, 720, 960)))
+THUMBNAIL_ASPECT = getattr(settings, 'THUMBNAIL_ASPECT', (960, 339))
+# Атрибут sizes: какую ширину картинка занимает на странице.
+THUMBNAIL_SIZES_ATTR: str = getattr(
+    settings, 'THUMBNAIL_SIZES_ATTR', '(max-width: 960px) 100vw, 960px')
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def _geometry(width: int) -> str:
+    aspect_width, aspect_height = THUMBNAIL_ASPECT
+    return f'{width}x{round(width * aspect_height / aspect_width)}'
+
+
+# Размеры миниатюр, которые выводятся в шаблонах.
+THUMBNAIL_SIZES = tuple(
+    (_geometry(width), THUMBNAIL_OPTIONS)
+    for width in sorted(THUMBNAIL_WIDTHS)
+)
+# Число потоков нарезки; при 0 миниатюры строятся сразу в вызывающем потоке.
+THUMBNAIL_WORKERS: int = getattr(settings, 'THUMBNAIL_WORKERS', 2)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class LadderThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который строит все размеры за одно декодирование.
+
+    Имена и записи в хранилище ключей совпадают с get_thumbnail,
+    поэтому миниатюры видны и тегу {% thumbnail %}.
+    """
+
+    def _resolve(self, source, geometry_string, options):
+        """Полные опции и файл миниатюры, как их вычисляет sorl."""
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return options, ImageFile(name, default.storage)
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры без обращения к хранилищу ключей."""
+        return self._resolve(ImageFile(file_), geometry_string, options)[1]
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра из хранилища ключей без построения."""
+        _, thumbnail = self._resolve(
+            ImageFile(file_), geometry_string, options)
+        return default.kvstore.get(thumbnail)
+
+    def create_ladder(self, file_, sizes) -> None:
+        """Строит миниатюры всех размеров sizes из одного декодирования.
+
+        Как и get_thumbnail, существующие файлы не перезаписываются:
+        хранилище дало бы новому файлу другое имя и другой ключ.
+        """
+        source = ImageFile(file_)
+        missing = []
+        for geometry, options in sizes:
+            options, thumbnail = self._resolve(source, geometry, options)
+            if thumbnail.exists():
+                default.kvstore.get_or_set(source)
+                default.kvstore.set(thumbnail, source)
+            else:
+                missing.append((geometry, options, thumbnail))
+        if not missing:
+            return
+        source_image = default.engine.get_image(source)
+        try:
+            image_info = default.engine.get_image_info(source_image)
+            source.set_size(default.engine.get_image_size(source_image))
+            for geometry, options, thumbnail in missing:
+                options['image_info'] = image_info
+                self._create_thumbnail(
+                    source_image, geometry, options, thumbnail)
+                default.kvstore.get_or_set(source)
+                default.kvstore.set(thumbnail, source)
+        finally:
+            default.engine.cleanup(source_image)
+
+
+def ready_thumbnail(file_, geometry_string, **options):
+    """Готовая миниатюра или None, если она ещё не построена."""
+    if not file_:
+        return None
+    return LadderThumbnailBackend().get_ready_thumbnail(
+        file_, geometry_string, **options)
+
+
+def ready_srcset(post):
+    """Готовые миниатюры лесенки поста по возрастанию ширины."""
+    if not post.image:
+        return []
+    prefetched = getattr(post, '_prefetched_srcset', None)
+    if prefetched is not None:
+        return prefetched
+    prefetch_srcsets([post])
+    return post._prefetched_srcset
+
+
+def prefetch_srcsets(posts) -> None:
+    """Достаёт миниатюры всех постов одним пакетным чтением.
+
+    Без него каждая миниатюра каждого поста — отдельное обращение
+    к хранилищу ключей sorl.
+    """
+    backend = LadderThumbnailBackend()
+    wanted = [
+        (post, [
+            backend.thumbnail_file(post.image, geometry, **options)
+            for geometry, options in THUMBNAIL_SIZES
+        ])
+        for post in posts if post.image
+    ]
+    files = [thumbnail for _, thumbnails in wanted
+             for thumbnail in thumbnails]
+    if hasattr(default.kvstore, 'get_many'):
+        found = default.kvstore.get_many(files)
+    else:
+        found = {
+            thumbnail.key: default.kvstore.get(thumbnail)
+            for thumbnail in files
+        }
+    for post, thumbnails in wanted:
+        post._prefetched_srcset = [
+            found[thumbnail.key] for thumbnail in thumbnails
+            if found.get(thumbnail.key)
+        ]
+
+
+def generate_thumbnails(name: str) -> None:
+    """Строит все миниатюры картинки и обновляет карточки её постов."""
+    source = ImageFile(name, post_image_storage)
+    try:
+        LadderThumbnailBackend().create_ladder(source, THUMBNAIL_SIZES)
+        for alias in shards():
+            posts = list(
+                Post.objects.using(alias).filter(image=name)
+                .only('author_id', 'group_id'))
+            Post.objects.using(alias).filter(
+                pk__in=[post.pk for post in posts],
+            ).update(updated=timezone.now())
+            for post in posts:
+                bump_post_feeds(post)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', name)
+    finally:
+        if THUMBNAIL_WORKERS:
+            close_old_connections()
+
+
+def delete_image(name: str) -> None:
+    """Удаляет файл картинки вместе с её миниатюрами."""
+    delete(ImageFile(name, post_image_storage))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def schedule_thumbnails(name: str) -> None:
+    """Ставит нарезку миниатюр в очередь после фиксации транзакции."""
+    if not THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: generate_thumbnails(name))
+        return
+    transaction.on_commit(
+        lambda: _get_executor().submit(generate_thumbnails, name))
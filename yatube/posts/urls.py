@@ -22,6 +22,16 @@ urlpatterns = [
          views.post_detail,
          name='post_detail'
          ),
+    # Поиск по тексту постов
+    path('search/',
+         views.search,
+         name='search'
+         ),
+    # Картинка поста нужного размера по подписанной ссылке
+    path('images/<str:token>/',
+         views.resize_image,
+         name='resize_image'
+         ),
     # Создание поста
     path('create/',
          views.PostCreateView.as_view(),
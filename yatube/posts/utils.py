@@ -1,8 +1,280 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import heapq
+from operator import itemgetter
 
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from .sharding import posts_by_ids, sharding_enabled
 
-def paginator(request, posts_list: dict, posts_in_page: int) -> dict:
-    """Функция паджинатора."""
-    paginator = Paginator(posts_list, posts_in_page)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+
+def encode_cursor(pub_date, pk) -> str:
+    """Упаковывает ключ (pub_date, id) в непрозрачный токен."""
+    raw = f'{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: str):
+    """Распаковывает токен курсора, для битого токена возвращает None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id).
+
+    Страницы по курсору выбираются одним запросом с условием по ключу
+    вместо OFFSET, поэтому их стоимость не зависит от глубины.
+    """
+
+    key_fields = ('pub_date', 'pk')
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, with_count=True, **kwargs):
+        super().__init__(
+            object_list.order_by(*self.ordering), per_page, **kwargs)
+        self.with_count = with_count
+
+    @property
+    def ordering(self):
+        return tuple(f'-{field}' for field in self.key_fields)
+
+    @cached_property
+    def count(self):
+        """Число записей без сортировки и аннотаций ленты."""
+        return self.object_list.order_by().values('pk').count()
+
+    def get_elided_page_range(self, number=1, *, on_each_side=2, on_ends=1):
+        """Номера страниц вокруг текущей, первые и последние.
+
+        Пропуски обозначаются ELLIPSIS, поэтому длина списка ограничена
+        при любом числе страниц.
+        """
+        number = self.validate_number(number)
+        if self.num_pages <= (on_each_side + on_ends) * 2:
+            return list(self.page_range)
+        pages = []
+        if number > on_each_side + on_ends + 2:
+            pages.extend(range(1, on_ends + 1))
+            pages.append(self.ELLIPSIS)
+            pages.extend(range(number - on_each_side, number + 1))
+        else:
+            pages.extend(range(1, number + 1))
+        if number < self.num_pages - on_each_side - on_ends - 1:
+            pages.extend(range(number + 1, number + on_each_side + 1))
+            pages.append(self.ELLIPSIS)
+            pages.extend(range(self.num_pages - on_ends + 1,
+                               self.num_pages + 1))
+        else:
+            pages.extend(range(number + 1, self.num_pages + 1))
+        return pages
+
+    def _after(self, cursor):
+        (date_field, pk_field), (pub_date, pk) = self.key_fields, cursor
+        return (Q(**{f'{date_field}__lt': pub_date})
+                | Q(**{date_field: pub_date, f'{pk_field}__lt': pk}))
+
+    def _before(self, cursor):
+        (date_field, pk_field), (pub_date, pk) = self.key_fields, cursor
+        return (Q(**{f'{date_field}__gt': pub_date})
+                | Q(**{date_field: pub_date, f'{pk_field}__gt': pk}))
+
+    def _objects(self, rows):
+        """Превращает выбранные строки в объекты страницы."""
+        return rows
+
+    def _entries(self, rows):
+        """Пары (ключ, объект) для выбранных строк.
+
+        Строки, для которых объекта не нашлось, пропускаются.
+        """
+        rows = list(rows)
+        keys = [
+            tuple(getattr(row, field) for field in self.key_fields)
+            for row in rows
+        ]
+        return [
+            (key, obj) for key, obj in zip(keys, self._objects(rows))
+            if obj is not None
+        ]
+
+    def _fetch(self, cursor=None, backwards=False, offset=0, limit=None):
+        """До limit (по умолчанию per_page + 1) записей после курсора.
+
+        При backwards=True записи берутся перед курсором
+        и идут в порядке возрастания ключа.
+        """
+        if limit is None:
+            limit = self.per_page + 1
+        rows = self.object_list
+        if cursor is not None:
+            rows = rows.filter(
+                self._before(cursor) if backwards else self._after(cursor))
+        if backwards:
+            rows = rows.order_by(*self.key_fields)
+        return self._entries(rows[offset:offset + limit])
+
+    def encode_key(self, key) -> str:
+        return encode_cursor(*key)
+
+    def decode_key(self, token: str):
+        return decode_cursor(token)
+
+    def _build_page(self, entries, number, has_previous, has_next) -> Page:
+        page = Page([obj for _, obj in entries], number, self)
+        page.previous_cursor = (
+            self.encode_key(entries[0][0])
+            if entries and has_previous else None)
+        page.next_cursor = (
+            self.encode_key(entries[-1][0])
+            if entries and has_next else None)
+        page.page_links = []
+        if self.with_count and number is not None:
+            page.page_links = self.get_elided_page_range(number)
+        return page
+
+    def first_page(self) -> Page:
+        """Первая страница ленты без подсчёта записей."""
+        entries = self._fetch()
+        has_next = len(entries) > self.per_page
+        return self._build_page(entries[:self.per_page], 1, False, has_next)
+
+    def page_after(self, cursor) -> Page:
+        """Страница, следующая за записью с ключом cursor."""
+        entries = self._fetch(cursor)
+        has_next = len(entries) > self.per_page
+        return self._build_page(
+            entries[:self.per_page], None, True, has_next)
+
+    def page_before(self, cursor) -> Page:
+        """Страница, предшествующая записи с ключом cursor."""
+        entries = self._fetch(cursor, backwards=True)
+        if len(entries) <= self.per_page:
+            # Дошли до начала ленты: отдаём полную первую страницу.
+            return self.first_page()
+        entries = entries[:self.per_page][::-1]
+        return self._build_page(entries, None, True, True)
+
+    def _uncounted_page(self, number) -> Page:
+        """Страница по номеру без COUNT: лишняя запись говорит о следующей."""
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        if number < 1:
+            number = 1
+        entries = self._fetch(offset=(number - 1) * self.per_page)
+        if not entries and number > 1:
+            return self.first_page()
+        has_next = len(entries) > self.per_page
+        return self._build_page(
+            entries[:self.per_page], number, number > 1, has_next)
+
+    def get_page(self, number) -> Page:
+        if not self.with_count:
+            return self._uncounted_page(number)
+        return super().get_page(number)
+
+    def page(self, number) -> Page:
+        """Страница по номеру; дополнительно снабжается курсорами."""
+        if not self.with_count:
+            return self._uncounted_page(number)
+        page = super().page(number)
+        return self._build_page(
+            self._entries(page.object_list), page.number,
+            page.has_previous(), page.has_next())
+
+    def get_cursor_page(self, after=None, before=None) -> Page:
+        """Страница по токенам ?after= / ?before= из запроса."""
+        if after is not None:
+            cursor = self.decode_key(after)
+            if cursor is not None:
+                return self.page_after(cursor)
+        if before is not None:
+            cursor = self.decode_key(before)
+            if cursor is not None:
+                return self.page_before(cursor)
+        return self.first_page()
+
+
+class TimelinePaginator(CursorPaginator):
+    """Паджинатор материализованной ленты: листает записи TimelineEntry."""
+
+    key_fields = ('pub_date', 'post_id')
+
+    def _objects(self, rows):
+        if not sharding_enabled():
+            return [entry.post for entry in rows]
+        # Посты лежат в шардах: догружаем их по id из ленты.
+        posts = posts_by_ids(
+            [entry.post_id for entry in rows],
+            {entry.post_id: entry.author_id for entry in rows})
+        return [posts.get(entry.post_id) for entry in rows]
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Паджинатор, сливающий несколько лент с общим ключом (pub_date, id).
+
+    Из каждой ленты берётся не больше per_page + 1 записей за курсором,
+    затем они сливаются heapq.merge в порядке убывания ключа.
+    Одна и та же запись из разных лент выводится один раз.
+    Общее число записей не считается.
+    """
+
+    def __init__(self, paginators, per_page, with_count=False, **kwargs):
+        Paginator.__init__(self, [], per_page, **kwargs)
+        self.paginators = [
+            paginator_class(object_list, per_page, with_count=False)
+            for paginator_class, object_list in paginators
+        ]
+        self.with_count = False
+
+    def _fetch(self, cursor=None, backwards=False, offset=0, limit=None):
+        if limit is None:
+            limit = self.per_page + 1
+        limit += offset
+        sources = [
+            paginator._fetch(cursor, backwards, limit=limit)
+            for paginator in self.paginators
+        ]
+        merged = heapq.merge(
+            *sources, key=itemgetter(0), reverse=not backwards)
+        entries, last_key = [], None
+        for key, obj in merged:
+            if key == last_key:
+                continue
+            entries.append((key, obj))
+            last_key = key
+            if len(entries) == limit:
+                break
+        return entries[offset:]
+
+
+def paginator(request, posts_list, posts_in_page: int,
+              with_count: bool = True,
+              paginator_class=CursorPaginator) -> Page:
+    """Функция паджинатора.
+
+    Параметры ?after= / ?before= дают страницу по курсору,
+    ?page= сохранён для прямых ссылок на номер страницы.
+    С with_count=False общее число записей не считается
+    и ссылки на номера страниц не выводятся.
+    """
+    paginator = paginator_class(
+        posts_list, posts_in_page, with_count=with_count)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after is not None or before is not None:
+        return paginator.get_cursor_page(after=after, before=before)
+    return paginator.get_page(request.GET.get('page'))
@@ -1,3 +1,8 @@
+from urllib.parse import urlencode
+
+from django.http import FileResponse, Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse_lazy
 from django.shortcuts import redirect
@@ -6,8 +11,17 @@ from django.views.generic.list import ListView
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import get_user_model
-from .models import Post, Group, Comment, Follow
+from .models import Post, Group, Comment, Follow, UserStats, TimelineEntry
 from .forms import PostForm, CommentForm
+from .cache import (
+    cache_anonymous_page, feed_cache_key, feed_etag, feed_slot, feed_version,
+    page_etag)
+from .feeds import follow_feed_page, posts_page
+from .routers import stick_to_primary
+from .resize import RESIZE_FORMATS, InvalidVariant, get_variant, load_variant
+from .search import SearchPaginator, highlight, search_enabled
+from .sharding import post_shard, shard_for_author, with_related
+from .thumbnails import schedule_thumbnails
 from .utils import paginator
 
 
@@ -15,23 +29,109 @@ User = get_user_model()
 POSTS_OUTPUT_COUNT: int = 10
 
 
+def index_etag(request):
+    return feed_etag(request, 'index')
+
+
+@method_decorator(condition(etag_func=index_etag), name='get')
+@method_decorator(cache_anonymous_page(index_etag), name='get')
 class IndexView(ListView):
     """Возвращает главную страницу."""
 
     model = Post
     template_name = 'posts/index.html'
 
+    def get_queryset(self):
+        return Post.objects.for_feed()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        page_obj = paginator(
-            self.request, self.object_list, POSTS_OUTPUT_COUNT)
+        # Главная лента самая длинная: COUNT по ней не выполняем.
+        page_obj = posts_page(
+            self.request, self.object_list, POSTS_OUTPUT_COUNT,
+            with_count=False)
         context.update(
             title='Последние обновления на сайте',
             page_obj=page_obj,
+            feed_slot=feed_slot(self.request, 'index'),
+            feed_cache_key=feed_cache_key(self.request, 'index'),
         )
         return context
 
 
+def _page_group(request, slug):
+    """Группа страницы, одна на валидатор и саму страницу."""
+    if not hasattr(request, '_page_group'):
+        request._page_group = Group.objects.filter(slug=slug).first()
+    return request._page_group
+
+
+def _page_author(request, username):
+    """Автор профиля, один на валидатор и саму страницу."""
+    if not hasattr(request, '_page_author'):
+        request._page_author = (
+            User.objects.select_related('stats')
+            .filter(username=username)
+            .first()
+        )
+    return request._page_author
+
+
+def group_etag(request, slug):
+    group = _page_group(request, slug)
+    if group is None:
+        return None
+    return feed_etag(request, 'group', group.pk)
+
+
+def profile_etag(request, username):
+    author = _page_author(request, username)
+    if author is None:
+        return None
+    return feed_etag(request, 'profile', author.pk)
+
+
+def _post_shard(request, post_id):
+    """Шард поста, один на валидаторы и саму страницу."""
+    if not hasattr(request, '_post_shard'):
+        request._post_shard = post_shard(post_id)
+    return request._post_shard
+
+
+def _post_validators(request, post_id):
+    """Дата изменения и автор поста, один запрос на оба валидатора."""
+    if not hasattr(request, '_post_validators'):
+        request._post_validators = (
+            Post.objects.using(_post_shard(request, post_id))
+            .filter(pk=post_id)
+            .values_list('updated', 'author_id')
+            .first()
+        )
+    return request._post_validators
+
+
+def post_etag(request, post_id):
+    """Пост, его комментарии и счётчик постов автора в шапке."""
+    validators = _post_validators(request, post_id)
+    if validators is None:
+        return None
+    updated, author_id = validators
+    return page_etag(
+        request, 'post', post_id, updated.timestamp(),
+        feed_version('profile', author_id))
+
+
+def post_last_modified(request, post_id):
+    # Форма комментария вошедшего пользователя зависит от CSRF-токена,
+    # который дата изменения поста не описывает: только ETag.
+    if request.user.is_authenticated:
+        return None
+    validators = _post_validators(request, post_id)
+    return validators[0] if validators else None
+
+
+@method_decorator(condition(etag_func=group_etag), name='get')
+@method_decorator(cache_anonymous_page(group_etag), name='get')
 class GroupPostsView(ListView):
     """Возвращает посты выбранной группы."""
     model = Group
@@ -39,28 +139,45 @@ class GroupPostsView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        group = self.get_queryset().get(slug=self.kwargs['slug'])
-        page_obj = paginator(
-            self.request, group.posts.all(), POSTS_OUTPUT_COUNT)
+        group = _page_group(self.request, self.kwargs['slug'])
+        if group is None:
+            raise Http404('Группа не найдена')
+        page_obj = posts_page(
+            self.request,
+            Post.objects.for_feed().filter(group=group),
+            POSTS_OUTPUT_COUNT)
         context.update(
             title=str(group),
             group=group,
-            page_obj=page_obj
+            page_obj=page_obj,
+            feed_slot=feed_slot(self.request, 'group', group.pk),
+            feed_cache_key=feed_cache_key(self.request, 'group', group.pk),
         )
         return context
 
 
+@condition(etag_func=profile_etag)
+@cache_anonymous_page(profile_etag)
 def profile(request, username):
     """Выводит профайл пользователя."""
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    posts_user = Post.objects.filter(author=author)
+    author = _page_author(request, username)
+    if author is None:
+        raise Http404('Пользователь не найден')
+    posts_user = (
+        Post.objects.using(shard_for_author(author.pk))
+        .for_feed()
+        .filter(author=author)
+    )
+    stats = UserStats.objects.for_user(author)
     context = {
         'title': f'Профайл пользователя {username}',
         'page_obj': paginator(request, posts_user, POSTS_OUTPUT_COUNT),
         'author': author,
-        'posts_count': posts_user.count(),
-        'follower_count': author.following.count(),
+        'posts_count': stats.posts_count,
+        'follower_count': stats.followers_count,
+        'feed_slot': feed_slot(request, 'profile', author.pk),
+        'feed_cache_key': feed_cache_key(request, 'profile', author.pk),
     }
     if request.user.is_authenticated:
         following = request.user.follower.filter(
@@ -69,21 +186,81 @@ def profile(request, username):
     return render(request, template, context)
 
 
+def search(request):
+    """Выводит найденные по тексту посты, самые релевантные первыми."""
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    if search_enabled():
+        page_obj = paginator(
+            request, query, POSTS_OUTPUT_COUNT, with_count=False,
+            paginator_class=SearchPaginator)
+    else:
+        page_obj = posts_page(
+            request,
+            Post.objects.for_feed().filter(text__icontains=query)
+            if query else Post.objects.none(),
+            POSTS_OUTPUT_COUNT, with_count=False)
+    for post in page_obj:
+        post.snippet = highlight(post.text, query)
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'query_prefix': urlencode({'q': query}) + '&',
+        'page_obj': page_obj,
+    }
+    return render(request, template, context)
+
+
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
+@cache_anonymous_page(post_etag)
 def post_detail(request, post_id):
     """Выводит пост и информацию о нём по ID."""
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
+    posts = Post.objects.using(_post_shard(request, post_id))
+    post = get_object_or_404(
+        with_related(posts, 'author__stats', 'group'), pk=post_id)
     context = {
         'title': post.text[:30],
         'post': post,
-        'posts_count': post.author.posts.count(),
-        'comments': post.comments.all(),
+        'posts_count': UserStats.objects.for_user(post.author).posts_count,
+        'comments': with_related(post.comments.all(), 'author'),
         'form': CommentForm(),
-        'comments_count': post.comments.count()
+        'comments_count': post.comments_count
     }
     return render(request, template, context)
 
 
+def _open_variant(image, width, height, crop, fmt):
+    """Ключ и открытый файл варианта картинки."""
+    key, path = get_variant(image, width, height, crop, fmt)
+    try:
+        return key, open(path, 'rb')
+    except FileNotFoundError:
+        # Дисковый кэш мог вытеснить вариант сразу после нарезки.
+        key, path = get_variant(image, width, height, crop, fmt)
+        return key, open(path, 'rb')
+
+
+def resize_image(request, token):
+    """Отдаёт картинку поста в размере из подписанной ссылки."""
+    try:
+        post_id, width, height, crop, fmt = load_variant(token)
+    except InvalidVariant:
+        raise Http404('Ссылка на картинку недействительна')
+    post = get_object_or_404(
+        Post.objects.using(post_shard(post_id)).only('image'), pk=post_id)
+    if not post.image:
+        raise Http404('У поста нет картинки')
+    try:
+        key, file = _open_variant(post.image, width, height, crop, fmt)
+    except OSError:
+        raise Http404('Картинка поста недоступна')
+    response = FileResponse(file, content_type=RESIZE_FORMATS[fmt][1])
+    response['ETag'] = f'"{key}"'
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
 class PostViewMixin:
     """Примись для классов редактирования и создания поста."""
 
@@ -96,7 +273,12 @@ class PostCreateView(LoginRequiredMixin, PostViewMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
-        return super().form_valid(form)
+        stick_to_primary(self.request)
+        response = super().form_valid(form)
+        # Миниатюры новой картинки строятся в фоне, а не при показе поста.
+        if 'image' in form.changed_data and self.object.image:
+            schedule_thumbnails(self.object.image.name)
+        return response
 
     def get_success_url(self) -> str:
         author = self.request.user.username
@@ -120,6 +302,10 @@ class PostEditView(
 
     model = Post
 
+    def get_queryset(self):
+        return Post.objects.using(
+            _post_shard(self.request, self.kwargs['pk']))
+
     def test_func(self):
         obj = self.get_object()
         return obj.author == self.request.user
@@ -149,8 +335,12 @@ class AddCommentView(LoginRequiredMixin, CommentForm, CreateView):
     model = Comment
 
     def form_valid(self, form):
-        form.instance.post = get_object_or_404(Post, pk=self.kwargs.get("pk"))
+        post_id = self.kwargs.get("pk")
+        form.instance.post = get_object_or_404(
+            Post.objects.using(_post_shard(self.request, post_id)),
+            pk=post_id)
         form.instance.author = self.request.user
+        stick_to_primary(self.request)
         return super().form_valid(form)
 
     def get_success_url(self) -> str:
@@ -163,12 +353,12 @@ class FollowIndexView(LoginRequiredMixin, ListView):
     model = Post
     template_name = 'posts/follow.html'
 
+    def get_queryset(self):
+        return TimelineEntry.objects.for_feed(self.request.user)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        posts = self.get_queryset().filter(
-            author__following__user=self.request.user)
-        page_obj = paginator(
-            self.request, posts, POSTS_OUTPUT_COUNT)
+        page_obj = follow_feed_page(self.request, POSTS_OUTPUT_COUNT)
         context.update(
             page_obj=page_obj,
             title='Ваша лента'
@@ -180,6 +370,7 @@ class FollowIndexView(LoginRequiredMixin, ListView):
 def follow_to_author(request, username):
     author = User.objects.get(username=username)
     user = request.user
+    stick_to_primary(request)
     if author != user:
         Follow.objects.get_or_create(user=user, author=author)
     return redirect('posts:profile', username=username)
@@ -187,6 +378,7 @@ def follow_to_author(request, username):
 
 @login_required
 def unfollow_to_author(request, username):
+    stick_to_primary(request)
     Follow.objects.filter(
         user=request.user, author__username=username).delete()
     return redirect('posts:profile', username=username)
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'posts.routers.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,6 +94,31 @@ DATABASES = {
     }
 }
 
+# Посты читаются с реплик из REPLICA_DATABASES (алиасы DATABASES),
+# запись идёт в default. Автор изменения REPLICA_STICKY_SECONDS секунд
+# читает из default. Без реплик всё работает с одной базой.
+DATABASE_ROUTERS = [
+    'posts.routers.ShardRouter',
+    'posts.routers.ReplicaRouter',
+]
+REPLICA_DATABASES = []
+REPLICA_STICKY_SECONDS = 10
+
+# Посты и комментарии хранятся в базе шарда автора: POST_SHARDS[author_id
+# % len(POST_SHARDS)], алиасы из DATABASES. Пустой список — всё в default.
+POST_SHARDS = []
+
+# Прагмы каждого нового соединения SQLite: в режиме WAL запись не
+# блокирует читателей, а занятая база ждёт busy_timeout мс, а не падает.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'memory',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -148,8 +174,64 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 # 403csrf
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Лента подписок: сколько постов добавлять при подписке и с какого
+# числа подписчиков посты автора подмешиваются при чтении.
+FEED_BACKFILL_LIMIT = 1000
+FEED_CELEBRITY_THRESHOLD = 10000
+
+# Фрагменты лент сбрасываются по версиям при изменении постов,
+# поэтому срок жизни может быть долгим.
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Через FEED_CACHE_SOFT_TIMEOUT секунд фрагмент пересчитывает один
+# запрос, остальные до конца FEED_CACHE_TIMEOUT получают прежнюю копию.
+# В отладке и тестах пересчёт идёт в потоке запроса, как и нарезка
+# миниатюр.
+FEED_CACHE_SOFT_TIMEOUT = 60
+FEED_REFRESH_WORKERS = 0 if DEBUG else 2
+
+# Загруженные картинки уменьшаются до IMAGE_MAX_SIZE по большей стороне
+# и сохраняются в WebP с качеством IMAGE_QUALITY.
+IMAGE_MAX_SIZE = 2560
+IMAGE_QUALITY = 80
+
+# Ширины миниатюр для srcset; высота следует пропорциям кадра ленты.
+THUMBNAIL_WIDTHS = (480, 720, 960)
+THUMBNAIL_ASPECT = (960, 339)
+THUMBNAIL_SIZES_ATTR = '(max-width: 960px) 100vw, 960px'
+
+# Варианты картинок по подписанной ссылке: предельная сторона
+# и объём дискового кэша готовых вариантов.
+RESIZE_MAX_SIZE = 2560
+RESIZE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Хранилище ключей sorl с пакетным чтением миниатюр страницы.
+THUMBNAIL_KVSTORE = 'posts.kvstore.BulkKVStore'
+
+# Потоки фоновой нарезки миниатюр; 0 — нарезать сразу после сохранения.
+# В отладке и тестах нарезка синхронная, чтобы фоновые потоки не писали
+# в базу и MEDIA_ROOT, которые уже убирает тестовый раннер.
+THUMBNAIL_WORKERS = 0 if DEBUG else 2
+
+# Воркеры одного хоста делят кэш в файле SQLite: фрагменты не
+# дублируются в памяти каждого процесса, а сброс версий виден всем.
+# В отладке и тестах достаточно кэша в памяти процесса.
+# Значения больше MIN_SIZE байт хранятся сжатыми.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'posts.compressed_cache.CompressedCache',
+        'OPTIONS': {
+            'CACHE': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            } if DEBUG else {
+                'BACKEND': 'posts.sqlite_cache.SQLiteCache',
+                'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+                'OPTIONS': {
+                    'MAX_ENTRIES': 100000,
+                    'MAX_BYTES': 256 * 1024 * 1024,
+                },
+            },
+            'CODEC': 'zlib',
+            'MIN_SIZE': 1024,
+        },
     }
 }